@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+This script benchmarks the download throughput (MB/s) of one S3 object with
+the default boto3 transfer and with the byte range transfer engine
+(transfer.py) for several chunk sizes and concurrencies, to choose the
+TRANSFER_CHUNK_SIZE_MB and TRANSFER_CONCURRENCY values of the environment file.
+
+Example call:
+    python3 benchmark_transfer.py ../.env-example 1994/01/1994010100/bfg_1994010100_fhr06_control \\
+        --chunk-sizes 8 32 64 --concurrency 4 8 16
+"""
+
+import os
+import time
+import pathlib
+import tempfile
+import argparse
+from dotenv import load_dotenv
+
+import storage
+import transfer
+
+def time_download(download, file_path):
+    start = time.perf_counter()
+    size = download(file_path)
+    elapsed = time.perf_counter() - start
+    os.remove(file_path)
+    return size, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark S3 download throughput of one object")
+    parser.add_argument('input_env', help="file name and relative location of the environment file")
+    parser.add_argument('key', help="key of the object to download, relative to the bucket root")
+    parser.add_argument('--chunk-sizes', nargs='+', type=float, default=[8, 32, 64], help="chunk sizes (MB) to try")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[4, 8, 16], help="concurrent ranges to try")
+    parser.add_argument('--repeat', type=int, default=1, help="downloads per setting, the best is reported")
+    args = parser.parse_args()
+
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), args.input_env)
+    load_dotenv(env_path)
+    bucket = storage.get_bucket()
+
+    settings = [('boto3 default', None, None)]
+    settings += [(f"{chunk_size:g} MB x {concurrency}", chunk_size, concurrency)
+                 for chunk_size in args.chunk_sizes for concurrency in args.concurrency]
+
+    with tempfile.TemporaryDirectory(dir=os.getenv('CYLC_TASK_WORK_DIR')) as tmp_dir:
+        file_path = os.path.join(tmp_dir, os.path.basename(args.key))
+        print(f"{'setting':>20} {'MB/s':>10}")
+        for label, chunk_size, concurrency in settings:
+            best = None
+            for _ in range(args.repeat):
+                if chunk_size is None:
+                    def download(path):
+                        bucket.download_file(args.key, path)
+                        return os.path.getsize(path)
+                else:
+                    def download(path):
+                        return transfer.download_file(bucket, args.key, path,
+                                                      chunk_size=int(chunk_size * 1024 * 1024),
+                                                      concurrency=concurrency)
+                size, elapsed = time_download(download, file_path)
+                throughput = size / (1024 * 1024) / elapsed
+                best = throughput if best is None else max(best, throughput)
+            print(f"{label:>20} {best:10.1f}")
+
+if __name__ == "__main__":
+    main()
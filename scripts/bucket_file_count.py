@@ -4,63 +4,243 @@
 Copyright 2025 NOAA
 All rights reserved.
 
-This script checks if files exist and are older than 30 minutes 
+This script checks if files exist and are older than 30 minutes
 for the given cycle in the S3 storage bucket provided in the environment variables.
 It assumes a folder structure of: BUCKET/KEY/files
+
+Large prefixes are listed as concurrent shards, see count_file_types().
+LISTING_WORKERS (default 8) sets the number of concurrent listings.
 """
 
 import sys
-import boto3
 import datetime as dt
-from botocore import UNSIGNED
-from botocore.client import Config
 from dotenv import load_dotenv
 import os
+import re
+import string
 import pathlib
+import fnmatch
+import collections
+import concurrent.futures
+
+import rate_limiter
+import tuning
+
+MIN_FILE_AGE_MINUTES = 30
+DEFAULT_LISTING_WORKERS = 8
+# alphabets in which object names are assumed to count, see get_split_points()
+KEY_ALPHABETS = [string.digits, string.ascii_uppercase, string.ascii_lowercase]
+EARLIEST = dt.datetime(1, 1, 1, tzinfo=dt.timezone.utc)
+
+def get_listing_workers(env=os.environ):
+    workers = env.get('LISTING_WORKERS')
+    if workers == '' or workers == None:
+        return DEFAULT_LISTING_WORKERS
+    return max(1, int(workers))
+
+def compile_file_types(file_types, prefix):
+    """returns a function giving the names of the file types whose templates
+    (fnmatch patterns, e.g. '*file.example') match the name of a key under
+    prefix. All templates are combined in one regular expression, one optional
+    lookahead group per file type, so every key is matched only once.
+    """
+    names = list(file_types)
+    pattern = re.compile(''.join(f"(?=(?P<t{i}>{fnmatch.translate(file_types[name])}))?"
+                                 for i, name in enumerate(names)))
+    def match(key):
+        groups = pattern.match(key[len(prefix):]).groups()
+        return [names[i] for i, group in enumerate(groups) if group is not None]
+    return match
+
+def _count_page(page, last=None, match=None):
+    """returns the count, latest modification time and {file type: count} of
+    the keys of a listing page up to last (inclusive), and whether last was
+    passed
+    """
+    file_count = 0
+    latest = EARLIEST
+    type_counts = collections.Counter()
+    for file in page.get('Contents', []):
+        if last is not None and file['Key'] > last:
+            return file_count, latest, type_counts, True
+        file_count+=1
+        if latest < file['LastModified']:
+            latest = file['LastModified']
+        if match is not None:
+            type_counts.update(match(file['Key']))
+    return file_count, latest, type_counts, False
+
+def get_split_points(first_key, last_key, last, n_points, min_length):
+    """returns up to n_points keys splitting the rest of a listing after
+    last_key (and up to last), guessed from a page of keys from first_key to
+    last_key. Object names are assumed to go on counting in the alphabet
+    (digits, upper or lower case letters) of their characters from the one
+    where first_key and last_key differ: the character is stepped up by 1, 2,
+    4, ... and so are the earlier characters, e.g. after bfg_00999 the points
+    are bfg_01, bfg_02, bfg_04, bfg_08, bfg_1, bfg_2, ... so that the shards
+    grow geometrically whatever the size of the rest. No character before
+    min_length (the listed prefix) is changed.
+    """
+    position = len(os.path.commonprefix([first_key, last_key]))
+    points = set()
+    for i in range(min(position, len(last_key) - 1), min_length - 1, -1):
+        for alphabet in KEY_ALPHABETS:
+            if last_key[i] not in alphabet:
+                continue
+            index = alphabet.index(last_key[i])
+            step = 1
+            while index + step < len(alphabet):
+                points.add(last_key[:i] + alphabet[index + step])
+                step *= 2
+    return sorted(point for point in points if last is None or point < last)[:n_points]
+
+def count_shard(client, bucket_name, shard, env=os.environ, match=None, idle_workers=None):
+    """lists the shard (prefix, start_after, last) page by page. Returns the
+    number of files with keys after start_after and up to last (inclusive),
+    the latest modification time among them, the number of files of each file
+    type recognized by match and the shards the rest of the listing was split
+    into. When a page is truncated and idle_workers() listings could run
+    next to this one, the rest is split at the keys of get_split_points() and
+    left to the caller, otherwise the listing goes on sequentially. Each page
+    counts against the 'list' rate limit.
+    """
+    prefix, start_after, last = shard
+    file_count = 0
+    latest = EARLIEST
+    type_counts = collections.Counter()
+    kwargs = {'Bucket': bucket_name, 'Prefix': prefix}
+    if start_after is not None:
+        kwargs['StartAfter'] = start_after
+    while True:
+        page = rate_limiter.call('list', client.list_objects_v2, env=env, **kwargs)
+        page_count, page_latest, page_type_counts, done = _count_page(page, last, match)
+        file_count += page_count
+        latest = max(latest, page_latest)
+        type_counts.update(page_type_counts)
+        if done or not page.get('IsTruncated'):
+            return file_count, latest, type_counts, []
+
+        keys = [file['Key'] for file in page.get('Contents', [])]
+        n_splits = 0 if idle_workers is None else idle_workers()
+        if n_splits > 0 and len(keys) > 0:
+            points = get_split_points(keys[0], keys[-1], last, n_splits, len(prefix))
+            if len(points) > 0:
+                bounds = [keys[-1]] + points + [last]
+                return file_count, latest, type_counts, [(prefix, bounds[i], bounds[i + 1])
+                                                         for i in range(len(bounds) - 1)]
+        kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+def count_range(client, bucket_name, prefix, start_after=None, last=None, env=os.environ, match=None):
+    """returns the number of files under prefix with keys after start_after
+    and up to last (inclusive), the latest modification time among them and
+    the number of files of each file type recognized by match, from a
+    sequential listing
+    """
+    file_count, latest, type_counts, _ = count_shard(client, bucket_name, (prefix, start_after, last),
+                                                     env, match)
+    return file_count, latest, type_counts
+
+def get_shards(client, bucket_name, prefix, env=os.environ, match=None):
+    """returns the (prefix, start_after, last) shards of the listing of prefix,
+    and the count, latest modification time and file type counts of the files
+    found while looking for the shards
+    """
+    page = rate_limiter.call('list', client.list_objects_v2, env=env, Bucket=bucket_name,
+                             Prefix=prefix, Delimiter='/')
+    if not page.get('IsTruncated'):
+        # every sub-prefix is listed on its own, the files directly under
+        # prefix are all on this page
+        file_count, latest, type_counts, _ = _count_page(page, None, match)
+        shards = [(sub_prefix['Prefix'], None, None) for sub_prefix in page.get('CommonPrefixes', [])]
+        return shards, file_count, latest, type_counts
+
+    keys = [file['Key'] for file in page.get('Contents', [])]
+    if len(page.get('CommonPrefixes', [])) > 0 or len(keys) == 0:
+        # the whole prefix is listed, and split as it goes
+        return [(prefix, None, None)], 0, EARLIEST, collections.Counter()
+
+    # a flat prefix: the page holds its first keys, the rest is split at the
+    # keys guessed from them
+    file_count, latest, type_counts, _ = _count_page(page, None, match)
+    points = get_split_points(keys[0], keys[-1], None, get_listing_workers(env), len(prefix))
+    bounds = [keys[-1]] + points + [None]
+    shards = [(prefix, bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+    return shards, file_count, latest, type_counts
+
+def count_file_types(bucket, prefix, file_types, env=os.environ):
+    """returns the number of files under prefix, the latest modification time
+    among them and {file type: count} for the {file type: template} of
+    file_types, all from a single listing. The listing is split into shards
+    (sub-prefixes, or key ranges guessed from the keys already listed) listed
+    concurrently by LISTING_WORKERS threads; shards which turn out to be large
+    are split again while the other workers are idle.
+    """
+    workers = get_listing_workers(env)
+    client = bucket.meta.client
+    match = None
+    if len(file_types) > 0:
+        match = compile_file_types(file_types, prefix)
+    shards, file_count, latest, type_counts = get_shards(client, bucket.name, prefix, env, match)
+
+    if len(shards) > 0:
+        pending = set()
+        def idle_workers():
+            return max(0, workers - len(pending))
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            pending.update(executor.submit(count_shard, client, bucket.name, shard, env, match,
+                                          idle_workers) for shard in shards)
+            # merged as the shards complete
+            while len(pending) > 0:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                pending.difference_update(done)
+                for future in done:
+                    shard_count, shard_latest, shard_type_counts, new_shards = future.result()
+                    file_count += shard_count
+                    latest = max(latest, shard_latest)
+                    type_counts.update(shard_type_counts)
+                    pending.update(executor.submit(count_shard, client, bucket.name, shard, env, match,
+                                                  idle_workers) for shard in new_shards)
+    return file_count, latest, {name: type_counts[name] for name in file_types}
+
+def count_files(bucket, prefix, env=os.environ):
+    """returns the number of files under prefix and the latest modification
+    time among them
+    """
+    file_count, latest, _ = count_file_types(bucket, prefix, {}, env)
+    return file_count, latest
 
-input_cycle = sys.argv[1]
-datetime_obj = dt.datetime.strptime(input_cycle, "%Y%m%dT%H")
-datetime_str = datetime_obj.strftime("%Y%m%d%H")
+def check_ready(file_count, latest, prefix, min_age_minutes=MIN_FILE_AGE_MINUTES):
+    if file_count == 0:
+        raise Exception("no files found in bucket " + prefix)
 
-input_env = sys.argv[2]
-env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), input_env)
-load_dotenv(env_path)
+    diff = dt.datetime.now(dt.timezone.utc) - latest
+    diff_minutes = diff.total_seconds() / 60
 
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-    
-if aws_access_key_id == '' or aws_access_key_id == None:
-    # move forward with unsigned request
-    s3_config_signature_version = UNSIGNED
-else:
-    s3_config_signature_version = 's3v4'
+    if diff_minutes < min_age_minutes:
+        raise Exception(f"the latest file is more recent than {min_age_minutes} minutes, try again later")
 
-s3 = boto3.resource(
-    's3',
-    aws_access_key_id=aws_access_key_id,    
-    aws_secret_access_key=aws_secret_access_key, 
-    config=Config(signature_version=s3_config_signature_version))
+def main():
+    # imported here, storage.py uses this module for S3 listings
+    import storage
 
-bucket = s3.Bucket(os.getenv('STORAGE_LOCATION_BUCKET'))
+    input_cycle = sys.argv[1]
+    datetime_obj = dt.datetime.strptime(input_cycle, "%Y%m%dT%H")
 
-prefix = datetime_obj.strftime(os.getenv('STORAGE_LOCATION_KEY') + "/")
+    input_env = sys.argv[2]
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), input_env)
+    load_dotenv(env_path)
+    tuning.apply()
 
-file_count = 0
-latest = dt.datetime(1, 1, 1, tzinfo=dt.timezone.utc)
-files = bucket.objects.filter(Prefix=prefix)
-for file in files: 
-    file_count+=1
-    if latest < file.last_modified:
-        latest = file.last_modified
+    files_storage = storage.get_storage()
 
-if file_count is 0:
-    raise Exception("no files found in bucket " + prefix)
+    prefix = datetime_obj.strftime(os.getenv('STORAGE_LOCATION_KEY') + "/")
 
-diff = dt.datetime.now(dt.timezone.utc) - latest 
-diff_minutes = diff.total_seconds() / 60
+    file_count, latest = files_storage.count_files(prefix)
+    check_ready(file_count, latest, prefix)
 
-if diff_minutes < 30:
-    raise Exception("the latest file is more recent than 30 minutes, try again later")
+    print("File count: ")
+    print(file_count)
 
-print("File count: ")
-print(file_count)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
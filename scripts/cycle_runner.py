@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Pipelined runner for catching up on many cycles in a single process. Instead of
+running file check, download, harvest and submit strictly in order for one
+cycle at a time, the stages are connected with bounded queues so that, e.g.,
+downloads for cycle N+1 overlap with harvesting and submitting cycle N:
+
+    list (storage)  ->  download (storage)  ->  harvest and submit (score-db)
+
+The list and download stages run as asyncio tasks (boto3 calls in threads)
+and the harvest/submit stage runs in a process pool, since score-db performs
+the harvesting as part of the request. The per-stat logic comes from the
+remote_files() and build_requests() functions of the db_{stat}.py scripts;
+every request a stat builds (e.g. one per variable shard when HARVEST_WORKERS
+is set) is a separate job in the pool. Submissions go through
+submission_spool so SPOOL_DIR is honored.
+
+The files of a cycle are listed once: stats declaring FILE_TYPES ({file type:
+template}) receive the count of each of their file types instead of the total.
+
+Listing and downloads go through the backend of storage.py selected by
+STORAGE_LOCATION_PLATFORM; with POSIX storage the files are harvested in place.
+
+Each stored cycle and stat is recorded with a marker file under the work
+directory, so that a retried run (e.g. a failed chunk of a chunked workflow)
+only processes the cycles and stats which did not complete, unless --redo is
+given.
+
+Several .env files can be given to monitor several experiments (streams) in
+one process, see run_experiments(). Streams usually cover different periods, an
+.env file given as ENV@START_CYCLE processes the same number of cycles as the
+others starting from its own START_CYCLE.
+
+Example calls:
+    python3 cycle_runner.py 19800101T00 19800201T00 ../.env-example \\
+        --stats file_count gsi_obsfit daily_mean_surface_analysis
+    python3 cycle_runner.py 19800101T00 19800201T00 ../.env-1979stream ../.env-1994stream@19940101T00
+"""
+
+import os
+import pathlib
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import datetime as dt
+import concurrent.futures
+from dotenv import dotenv_values
+
+import bucket_file_count
+import parallel_harvest
+import preflight
+import storage
+import task_profiler
+import tuning
+
+CYCLE_FORMAT = "%Y%m%dT%H"
+ENV_START_SEPARATOR = '@'
+COMPLETED_DIR = 'completed'
+DEFAULT_DOWNLOAD_WORKERS = 4
+# processes of the pool (CYCLE_RUNNER_WORKERS), not to be confused with the
+# daily variable shards (HARVEST_WORKERS)
+DEFAULT_HARVEST_WORKERS = 4
+def load_env(input_env):
+    """returns the environment of one experiment: the process environment
+    updated with the values of the .env file, os.environ is left untouched so
+    that several experiments can be processed side by side
+    """
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), input_env)
+    if not os.path.isfile(env_path):
+        raise FileNotFoundError(f"File {env_path} was not found, please provide the path to .env* file")
+    env = dict(os.environ)
+    env.update({k: v for k, v in dotenv_values(env_path).items() if v is not None})
+    return tuning.apply(env)
+
+def parse_input_env(input_env, start):
+    """returns the .env file and the first cycle of an ENV[@START_CYCLE]
+    argument, start when the argument has no cycle of its own
+    """
+    if ENV_START_SEPARATOR not in input_env:
+        return input_env, start
+    input_env, env_start = input_env.rsplit(ENV_START_SEPARATOR, 1)
+    return input_env, dt.datetime.strptime(env_start, CYCLE_FORMAT)
+
+def get_stat_module(stat):
+    return importlib.import_module('db_' + stat)
+
+def get_cycles(start, end, cycle_hours=6):
+    cycles = list()
+    datetime_obj = start
+    while datetime_obj <= end:
+        cycles.append(datetime_obj)
+        datetime_obj += dt.timedelta(hours=cycle_hours)
+    return cycles
+
+async def gather_all(*awaitables):
+    """waits for all the awaitables, even when some of them fail, and returns
+    their results. The first exception is raised once all are done, so that
+    nothing is still using the files when they are cleaned up.
+    """
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+def build_stat_requests(stat, cycle, file_paths, file_count, env):
+    """build the requests of one stat for one cycle, runs in a worker process"""
+    datetime_obj = dt.datetime.strptime(cycle, CYCLE_FORMAT)
+    return get_stat_module(stat).build_requests(datetime_obj, file_paths, file_count, env)
+
+class CycleRunner:
+    def __init__(self, env, stats, work_dir, queue_size=4, download_workers=4,
+                 harvest_workers=4, min_age_minutes=bucket_file_count.MIN_FILE_AGE_MINUTES,
+                 redo=False):
+        self.env = dict(env)
+        self.stats = stats
+        self.work_dir = work_dir
+        self.queue_size = queue_size
+        self.download_workers = download_workers
+        self.harvest_workers = harvest_workers
+        self.min_age_minutes = min_age_minutes
+        self.redo = redo
+        self.name = self.env.get('EXPERIMENT_NAME')
+        self.storage = storage.get_storage(self.env)
+        self.failures = list()
+        self.pool_slots = None
+
+    def stats_for_cycle(self, datetime_obj):
+        stats = list()
+        for stat in self.stats:
+            cycle_hours = getattr(get_stat_module(stat), 'CYCLE_HOURS', None)
+            if cycle_hours is None or datetime_obj.hour in cycle_hours:
+                stats.append(stat)
+        return stats
+
+    def get_completed_marker(self, cycle, stat):
+        return os.path.join(self.work_dir, COMPLETED_DIR, f"{cycle}.{stat}")
+
+    def is_completed(self, cycle, stat):
+        return not self.redo and os.path.exists(self.get_completed_marker(cycle, stat))
+
+    def set_completed(self, cycle, stat):
+        marker = self.get_completed_marker(cycle, stat)
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        with open(marker, 'w') as outfile:
+            outfile.write(dt.datetime.now(dt.timezone.utc).isoformat() + '\n')
+
+    def file_types(self):
+        """returns the {file type: template} counted by any of the stats"""
+        file_types = dict()
+        for stat in self.stats:
+            file_types.update(getattr(get_stat_module(stat), 'FILE_TYPES', {}))
+        return file_types
+
+    async def list_stage(self, cycles, download_queue):
+        file_types = self.file_types()
+        for datetime_obj in cycles:
+            cycle = datetime_obj.strftime(CYCLE_FORMAT)
+            due = self.stats_for_cycle(datetime_obj)
+            stats = [stat for stat in due if not self.is_completed(cycle, stat)]
+            if len(self.stats) > 0 and len(stats) == 0:
+                # nothing left to store for this cycle, no need to list it
+                if len(due) > 0:
+                    print(f"{self.name} {cycle}: already stored, skipped")
+                continue
+
+            prefix = datetime_obj.strftime(self.env.get('STORAGE_LOCATION_KEY') + "/")
+            try:
+                # a single listing per cycle for the readiness check and the
+                # counts of all file types
+                file_count, latest, type_counts = await asyncio.to_thread(
+                    self.storage.count_file_types, prefix, file_types)
+                bucket_file_count.check_ready(file_count, latest, prefix,
+                                              self.min_age_minutes)
+            except Exception as err:
+                print(f"{self.name} {cycle}: file check failed: {err}")
+                self.failures.append((cycle, 'file_check', err))
+                continue
+
+            print(f"{self.name} {cycle}: file check passed with {file_count} files")
+            for stat in stats:
+                stat_file_types = getattr(get_stat_module(stat), 'FILE_TYPES', None)
+                if stat_file_types is None:
+                    await download_queue.put((cycle, stat, file_count))
+                else:
+                    await download_queue.put((cycle, stat, {name: type_counts[name]
+                                                            for name in stat_file_types}))
+
+    async def download_stage(self, download_queue, harvest_queue):
+        while True:
+            cycle, stat, file_count = await download_queue.get()
+            try:
+                datetime_obj = dt.datetime.strptime(cycle, CYCLE_FORMAT)
+                stat_module = get_stat_module(stat)
+                skip_missing = getattr(stat_module, 'SKIP_MISSING_FILES', False)
+                task_dir = os.path.join(self.work_dir, cycle, stat)
+                os.makedirs(task_dir, exist_ok=True)
+
+                # check the whole file set before downloading anything
+                plan = await asyncio.to_thread(self.storage.plan_downloads,
+                                               stat_module.remote_files(datetime_obj, self.env))
+                if not skip_missing:
+                    preflight.check(plan)
+
+                downloads = [asyncio.to_thread(self.storage.fetch, prefix, file_name,
+                                               task_dir, skip_missing)
+                             for prefix, file_name, _ in plan.present]
+                file_paths = [path for path in await gather_all(*downloads)
+                              if path is not None]
+                await harvest_queue.put((cycle, stat, file_paths, file_count))
+            except Exception as err:
+                print(f"{self.name} {cycle}: download for {stat} failed: {err}")
+                self.failures.append((cycle, stat, err))
+            finally:
+                download_queue.task_done()
+
+    async def run_in_pool(self, executor, func, *args):
+        """runs func in the (possibly shared) process pool, holding one of the
+        harvest_workers slots of this experiment while it runs
+        """
+        async with self.pool_slots:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def harvest_stage(self, harvest_queue, executor):
+        while True:
+            cycle, stat, file_paths, file_count = await harvest_queue.get()
+            cycle_str = dt.datetime.strptime(cycle, CYCLE_FORMAT).strftime("%Y-%m-%d %H:%M:%S")
+            yaml_files = list()
+            # files read in place (POSIX storage) are neither spooled nor removed
+            local_copies = self.storage.local_copies(file_paths)
+            try:
+                yaml_files = await self.run_in_pool(executor, build_stat_requests, stat,
+                                                    cycle, file_paths, file_count, self.env)
+                # requests of a stat (e.g. variable shards) are submitted in
+                # parallel by the same pool
+                await gather_all(*[self.run_in_pool(executor, parallel_harvest.submit_request,
+                                                    yaml_file, cycle_str, local_copies, self.env)
+                                   for yaml_file in yaml_files])
+                self.set_completed(cycle, stat)
+                print(f"{self.name} {cycle}: {stat} stored")
+            except Exception as err:
+                print(f"{self.name} {cycle}: harvest/submit for {stat} failed: {err}")
+                self.failures.append((cycle, stat, err))
+            finally:
+                for path in list(yaml_files) + local_copies:
+                    if os.path.exists(path):
+                        os.remove(path)
+                harvest_queue.task_done()
+
+    async def run_stages(self, cycles, executor):
+        """run the pipeline for the cycles with a (possibly shared) process
+        pool. At most harvest_workers stats of this experiment are harvested
+        at a time, and at most harvest_workers of their requests (e.g.
+        variable shards) run in the pool at once, so a heavily sharded
+        experiment cannot take over a shared pool.
+        """
+        self.pool_slots = asyncio.Semaphore(self.harvest_workers)
+        download_queue = asyncio.Queue(maxsize=self.queue_size)
+        harvest_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        workers = [asyncio.create_task(self.download_stage(download_queue, harvest_queue))
+                   for _ in range(self.download_workers)]
+        workers += [asyncio.create_task(self.harvest_stage(harvest_queue, executor))
+                    for _ in range(self.harvest_workers)]
+
+        await self.list_stage(cycles, download_queue)
+        await download_queue.join()
+        await harvest_queue.join()
+
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return self.failures
+
+async def run_experiments(runners, cycles, download_workers, harvest_workers):
+    """run several experiments in one process sharing one process pool (and
+    with it the score-db connections of the workers), one download thread pool
+    and the S3 clients. cycles has the list of cycles of each runner. Each
+    experiment has its own queues and an equal share of the workers, so one
+    busy stream cannot starve the others.
+    """
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+        download_workers + len(runners)))
+
+    # the pool workers are started while the download and transfer threads
+    # run, forking the threaded process could leave a worker holding a lock
+    # copied at fork time
+    with concurrent.futures.ProcessPoolExecutor(harvest_workers,
+                                                mp_context=multiprocessing.get_context('forkserver'),
+                                                initializer=task_profiler.worker_initializer) as executor:
+        await asyncio.gather(*[runner.run_stages(runner_cycles, executor)
+                               for runner, runner_cycles in zip(runners, cycles)])
+    return [(runner.name,) + failure for runner in runners
+            for failure in runner.failures]
+
+def main():
+    parser = argparse.ArgumentParser(description="Run file checks and store data for a range of cycles as a pipeline")
+    parser.add_argument('start_cycle', help="first cycle, format %%Y%%m%%dT%%H")
+    parser.add_argument('end_cycle', help="last cycle (inclusive), format %%Y%%m%%dT%%H")
+    parser.add_argument('input_env', nargs='+',
+                        help="file name and relative location of the environment file, "
+                             "several files process several experiments concurrently, "
+                             "ENV@START_CYCLE shifts the cycles of an experiment to start at START_CYCLE")
+    parser.add_argument('--stats', nargs='+', default=['file_count'],
+                        help="stats to store, each must have a db_{stat}.py script")
+    parser.add_argument('--check-only', action='store_true',
+                        help="only run the file check of each cycle, no stats are stored")
+    parser.add_argument('--cycle-hours', type=int, default=6, help="hours between cycles")
+    parser.add_argument('--chunk-cycles', type=int, default=None,
+                        help="process at most this many cycles from start_cycle (used by chunked workflows)")
+    parser.add_argument('--queue-size', type=int, default=4, help="maximum items waiting between stages")
+    parser.add_argument('--download-workers', type=int, default=None,
+                        help="concurrent downloads, shared by all experiments "
+                             "(default: DOWNLOAD_WORKERS of the first environment file or 4)")
+    parser.add_argument('--harvest-workers', type=int, default=None,
+                        help="processes harvesting and submitting, shared by all experiments "
+                             "(default: CYCLE_RUNNER_WORKERS of the first environment file or 4)")
+    parser.add_argument('--redo', action='store_true',
+                        help="store the stats of cycles already recorded as completed again")
+    parser.add_argument('--min-age-minutes', type=float, default=bucket_file_count.MIN_FILE_AGE_MINUTES,
+                        help="minimum age of the latest file of a cycle before it is processed")
+    args = parser.parse_args()
+
+    start = dt.datetime.strptime(args.start_cycle, CYCLE_FORMAT)
+    input_envs = [parse_input_env(input_env, start) for input_env in args.input_env]
+    envs = [load_env(input_env) for input_env, _ in input_envs]
+    download_workers = args.download_workers
+    if download_workers is None:
+        download_workers = tuning.get_int('DOWNLOAD_WORKERS', DEFAULT_DOWNLOAD_WORKERS, envs[0])
+    harvest_workers = args.harvest_workers
+    if harvest_workers is None:
+        harvest_workers = tuning.get_int('CYCLE_RUNNER_WORKERS', DEFAULT_HARVEST_WORKERS, envs[0])
+
+    work_dir = os.getenv('CYLC_TASK_WORK_DIR')
+    if work_dir is None:
+        work_dir = pathlib.Path(__file__).parent.resolve()
+
+    cycles = get_cycles(start, dt.datetime.strptime(args.end_cycle, CYCLE_FORMAT),
+                        args.cycle_hours)
+    if args.chunk_cycles is not None:
+        cycles = cycles[:args.chunk_cycles]
+    if len(cycles) == 0:
+        print(f"No cycles between {args.start_cycle} and {args.end_cycle}")
+        return
+
+    stats = list() if args.check_only else args.stats
+    runners = [CycleRunner(env, stats, os.path.join(work_dir, env.get('EXPERIMENT_NAME')),
+                           args.queue_size,
+                           max(1, download_workers // len(envs)),
+                           max(1, harvest_workers // len(envs)),
+                           args.min_age_minutes, args.redo)
+               for env in envs]
+    # the range of each experiment, shifted to its own first cycle
+    runner_cycles = [[cycle + (env_start - start) for cycle in cycles]
+                     for _, env_start in input_envs]
+    failures = asyncio.run(run_experiments(runners, runner_cycles, download_workers,
+                                           harvest_workers))
+
+    if len(failures) > 0:
+        for name, cycle, stage, err in failures:
+            print(f"FAILED {name} {cycle} {stage}: {err}")
+        raise RuntimeError(f"{len(failures)} cycle/stat combinations failed") #generic exception to tell cylc to stop running
+    for runner, experiment_cycles in zip(runners, runner_cycles):
+        print(f"All {len(experiment_cycles)} cycles of {runner.name} from "
+              f"{experiment_cycles[0].strftime(CYCLE_FORMAT)} to "
+              f"{experiment_cycles[-1].strftime(CYCLE_FORMAT)} processed")
+
+if __name__ == "__main__":
+    main()
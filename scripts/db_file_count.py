@@ -4,80 +4,85 @@
 Copyright 2025 NOAA
 All rights reserved.
 
-This script counts the number of files in a given S3 bucket and saves the
-value in a database. This script relies on environment variables for the S3
-bucket and the location of the score-db executable. Folder structure is
+This script counts the number of files of each file type in FILE_TYPES in a
+given S3 bucket and saves the values in a database. All file types are counted
+from a single listing of the cycle, matching each key against the templates of
+every file type at once. This script relies on environment variables for the
+S3 bucket and the location of the score-db executable. Folder structure is
 assumed to be KEY/%Y/%M/CYCLE.
+
+The stage functions (remote_files, build_requests) are also used by
+cycle_runner.py.
 """
 
 import sys
-import boto3
-from botocore import UNSIGNED
-from botocore.client import Config
-import db_yaml_generator 
+import db_yaml_generator
+import storage
+import submission_spool
+import tuning
 import os
 import pathlib
 import datetime as dt
 from dotenv import load_dotenv
 
-from score_db import score_db_base
 from score_db import file_utils
 
-input_cycle = sys.argv[1]
-datetime_obj = dt.datetime.strptime(input_cycle, "%Y%m%dT%H")
-year = datetime_obj.strftime("%Y")
-month = datetime_obj.strftime("%m")
-datetime_str = datetime_obj.strftime("%Y%m%d%H")
-cycle_str = datetime_obj.strftime("%Y-%m-%d %H:%M:%S")
-
-input_env = sys.argv[2]
-env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), input_env)
-load_dotenv(env_path)
-
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-    
-if aws_access_key_id == '' or aws_access_key_id == None:
-    # move forward with unsigned request
-    s3_config_signature_version = UNSIGNED
-else:
-    s3_config_signature_version = 's3v4'
-
-s3 = boto3.resource(
-    's3',
-    aws_access_key_id=aws_access_key_id,    
-    aws_secret_access_key=aws_secret_access_key, 
-    config=Config(signature_version=s3_config_signature_version))
-
-bucket = s3.Bucket(os.getenv('STORAGE_LOCATION_BUCKET'))
-key = os.getenv('STORAGE_LOCATION_KEY')
-
-prefix = datetime_obj.strftime(os.getenv('STORAGE_LOCATION_KEY') + "/")
-    
-file_type = 'all_files_example'
-
-file_count = 0
-files = bucket.objects.filter(Prefix=prefix)
-for file in files: 
-    file_count+=1
-
-if file_count is 0:
-    raise Exception("no files found in bucket " + datetime_str)
-
-print("File count: ")
-print(file_count)
-
-yaml_file = db_yaml_generator.generate_file_count_yaml(file_count, file_type, None, None, prefix, cycle_str, 
-                                                       os.getenv('EXPERIMENT_NAME'), os.getenv('EXPERIMENT_WALLCLOCK_START'),
-                                                       os.getenv('STORAGE_LOCATION_BUCKET'), os.getenv('STORAGE_LOCATION_PLATFORM'), 
-                                                       os.getenv('STORAGE_LOCATION_KEY'))
-
-# validate configuration (yaml) file
-file_utils.is_valid_readable_file(yaml_file)
-# submit the score db request
-print("Calling score-db with yaml file: " + yaml_file + "for cycle: " + cycle_str)
-response = score_db_base.handle_request(yaml_file)
-if not response.success:
-    print(response.message)
-    print(response.errors)
-    raise RuntimeError("score-db returned a failure message") #generic exception to tell cylc to stop running 
+#registered file types counted, {name: file_template}, templates are fnmatch
+#patterns of the file names under the cycle prefix and should match the
+#file_template registered with db-registration.py. all_files_example is
+#registered with the placeholder template '*file.example' but has always
+#stored the total number of files of the cycle, so it is counted unfiltered.
+FILE_TYPES = {'all_files_example': '*', # every file of the cycle
+              #'bfg_example': 'bfg_*',
+              }
+
+def remote_files(datetime_obj, env=os.environ):
+    """the file count only needs the listing of the cycle prefix"""
+    return []
+
+def build_requests(datetime_obj, file_paths, file_count, env=os.environ):
+    """file_count is the {file type: count} of the cycle, one expt_file_counts
+    request is built per file type
+    """
+    datetime_str = datetime_obj.strftime("%Y%m%d%H")
+    cycle_str = datetime_obj.strftime("%Y-%m-%d %H:%M:%S")
+    prefix = datetime_obj.strftime(env.get('STORAGE_LOCATION_KEY') + "/")
+
+    if sum(file_count.values()) == 0:
+        raise Exception("no files found in bucket " + datetime_str)
+
+    yaml_files = list()
+    for file_type, count in file_count.items():
+        print(f"File count of {file_type}: {count}")
+        yaml_file = db_yaml_generator.generate_file_count_yaml(count, file_type, None, None, prefix, cycle_str,
+                                                               env.get('EXPERIMENT_NAME'), env.get('EXPERIMENT_WALLCLOCK_START'),
+                                                               env.get('STORAGE_LOCATION_BUCKET'), env.get('STORAGE_LOCATION_PLATFORM'),
+                                                               env.get('STORAGE_LOCATION_KEY'))
+
+        # validate configuration (yaml) file
+        file_utils.is_valid_readable_file(yaml_file)
+        yaml_files.append(yaml_file)
+    return yaml_files
+
+def main():
+    input_cycle = sys.argv[1]
+    datetime_obj = dt.datetime.strptime(input_cycle, "%Y%m%dT%H")
+    cycle_str = datetime_obj.strftime("%Y-%m-%d %H:%M:%S")
+
+    input_env = sys.argv[2]
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), input_env)
+    load_dotenv(env_path)
+    tuning.apply()
+
+    files_storage = storage.get_storage()
+
+    prefix = datetime_obj.strftime(os.getenv('STORAGE_LOCATION_KEY') + "/")
+
+    _, _, file_count = files_storage.count_file_types(prefix, FILE_TYPES)
+
+    for yaml_file in build_requests(datetime_obj, [], file_count):
+        # submit (or spool) the score db request
+        submission_spool.submit_request(yaml_file, cycle_str)
+
+if __name__ == "__main__":
+    main()
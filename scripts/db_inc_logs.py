@@ -17,20 +17,21 @@ registered as metric types.
 This script relies on environment variables for the S3 bucket and the location
 of the score-db executable. Folder structure is assumed to be
 KEY/%Y/%M/CYCLE/logs.
+
+The stage functions (remote_files, build_requests) are also used by
+cycle_runner.py.
 """
 
 import sys
-import boto3
-from botocore import UNSIGNED
-from botocore.client import Config
-from botocore.errorfactory import ClientError
-import db_yaml_generator 
+import db_yaml_generator
+import storage
+import submission_spool
+import tuning
 import os
 import pathlib
 import datetime as dt
 from dotenv import load_dotenv
 
-from score_db import score_db_base
 from score_db import file_utils
 
 #DICTIONARIES
@@ -45,73 +46,65 @@ variables = ['o3mr_inc', 'sphum_inc', 'T_inc', 'u_inc', 'v_inc',
                                   'delp_inc', 'delz_inc', 'pt_inc', 's_inc', 'u_inc', 'v_inc', 'SSH',
                                   'Salinity', 'Temperature', 'Speed of Currents']
 
-input_cycle = sys.argv[1]
-datetime_obj = dt.datetime.strptime(input_cycle, "%Y%m%dT%H")
-datetime_str = datetime_obj.strftime("%Y%m%d%H")
-cycle_str = datetime_obj.strftime("%Y-%m-%d %H:%M:%S")
-
-input_env = sys.argv[2]
-env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), input_env)
-load_dotenv(env_path)
-
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-
-if aws_access_key_id == '' or aws_access_key_id == None:
-    # move forward with unsigned request
-    s3_config_signature_version = UNSIGNED
-else:
-    s3_config_signature_version = 's3v4'
-
-s3 = boto3.resource(
-    's3',
-    aws_access_key_id=aws_access_key_id,    
-    aws_secret_access_key=aws_secret_access_key, 
-    config=Config(signature_version=s3_config_signature_version))
-
-bucket = s3.Bucket(os.getenv('STORAGE_LOCATION_BUCKET'))
-prefix = datetime_obj.strftime(os.getenv('STORAGE_LOCATION_KEY') + "/logs/")
-
-work_dir = os.getenv('CYLC_TASK_WORK_DIR')
-
-#harvester is built to handle one file at a time so make calls per listed file 
-for file_name in file_list:
-    #download file using unique name for each cycle 
-    file_path =  os.path.join(work_dir, file_name)
-
-    try:
-        bucket.download_file(prefix+file_name, file_path)
-    except ClientError as err:
-        if err.response['Error']['Code'] == "404":
-            print(f"File {file_name} not found at {prefix}. Moving on to the next file in list")
-            print(err)
+#missing log files are skipped rather than failing the task
+SKIP_MISSING_FILES = True
+
+def remote_files(datetime_obj, env=os.environ):
+    prefix = datetime_obj.strftime(env.get('STORAGE_LOCATION_KEY') + "/logs/")
+    return [(prefix, file_name) for file_name in sorted(file_list)]
+
+def build_requests(datetime_obj, file_paths, file_count, env=os.environ):
+    cycle_str = datetime_obj.strftime("%Y-%m-%d %H:%M:%S")
+
+    #harvester is built to handle one file at a time so make one request per file
+    yaml_files = list()
+    for file_path in file_paths:
+        #harvest: build harvest config, build yaml, call subprocess, statistic/variable combo needs to be registered to be saved in db
+        harvest_config = {
+            'harvester_name': 'inc_logs',
+            'filename': file_path,
+            'statistic': statistics,
+            'variable': variables,
+            'cycletime': cycle_str
+        }
+        yaml_file = db_yaml_generator.generate_harvest_metrics_yaml(env.get('EXPERIMENT_NAME'), env.get('EXPERIMENT_WALLCLOCK_START'),
+                                                        'inc_logs', harvest_config)
+
+        # validate configuration (yaml) file
+        file_utils.is_valid_readable_file(yaml_file)
+        yaml_files.append(yaml_file)
+    return yaml_files
+
+def main():
+    input_cycle = sys.argv[1]
+    datetime_obj = dt.datetime.strptime(input_cycle, "%Y%m%dT%H")
+    cycle_str = datetime_obj.strftime("%Y-%m-%d %H:%M:%S")
+
+    input_env = sys.argv[2]
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), input_env)
+    load_dotenv(env_path)
+    tuning.apply()
+
+    files_storage = storage.get_storage()
+
+    work_dir = os.getenv('CYLC_TASK_WORK_DIR')
+
+    for prefix, file_name in remote_files(datetime_obj):
+        #download file using unique name for each cycle
+        file_path = files_storage.fetch(prefix, file_name, work_dir, skip_missing=True)
+        if file_path is None:
             continue
-        else:
-            print(err)
-            raise err
-
-    #harvest: build harvest config, build yaml, call subprocess, statistic/variable combo needs to be registered to be saved in db
-    harvest_config = {
-        'harvester_name': 'inc_logs',
-        'filename': file_path, 
-        'statistic': statistics,
-        'variable': variables,
-        'cycletime': cycle_str
-    }
-    yaml_file = db_yaml_generator.generate_harvest_metrics_yaml(os.getenv('EXPERIMENT_NAME'), os.getenv('EXPERIMENT_WALLCLOCK_START'),
-                                                    'inc_logs', harvest_config)
-    
-    # validate configuration (yaml) file
-    file_utils.is_valid_readable_file(yaml_file)
-    # submit the score db request    
-    print("Calling score-db with yaml file: " + yaml_file + "for cycle: " + cycle_str)
-    response = score_db_base.handle_request(yaml_file)
-    if not response.success:
-        print(response.message)
-        print(response.errors)
-        raise RuntimeError("score-db returned a failure message") #generic exception to tell cylc to stop running 
-
-    #remove yaml and downloaded file 
-    os.remove(yaml_file)
-    os.remove(file_path)
-    print(f"Finished with file {file_name} at {prefix}") 
+        local_copies = files_storage.local_copies([file_path])
+
+        for yaml_file in build_requests(datetime_obj, [file_path], 1):
+            # submit (or spool) the score db request
+            submission_spool.submit_request(yaml_file, cycle_str, files=local_copies)
+
+            #remove yaml and downloaded file
+            os.remove(yaml_file)
+        for local_copy in local_copies:
+            os.remove(local_copy)
+        print(f"Finished with file {file_name} at {prefix}")
+
+if __name__ == "__main__":
+    main()
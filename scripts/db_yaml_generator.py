@@ -11,7 +11,7 @@ import pathlib
 import os
 import datetime as dt
 import json
-import random
+import tempfile
 
 YAML_FILE_PREFIX = 'monitoring-yaml-'
 
@@ -22,6 +22,16 @@ def get_work_dir():
         work_dir = os.getenv('CYLC_TASK_WORK_DIR')
     return work_dir
 
+def get_yaml_file_path(request_name):
+    """returns a new, unique yaml file in the work directory, many requests
+    can be generated within the same second
+    """
+    fd, yaml_file_path = tempfile.mkstemp(dir=get_work_dir(),
+                                          prefix=YAML_FILE_PREFIX + dt.datetime.now().strftime("%Y%m%d%H%M%S") + '-',
+                                          suffix='-' + request_name + '.yaml')
+    os.close(fd)
+    return yaml_file_path
+
 def generate_exp_reg_yaml(experiment_name, experiment_wallclock, cycle_start, cycle_end, owner_id, group_id, experiment_type, platform, description):
     yaml_file_path = os.path.join(get_work_dir(), YAML_FILE_PREFIX + dt.datetime.now().strftime("%Y%m%d%H%M%S") + '-exp_reg.yaml')
     
@@ -84,7 +94,7 @@ def generate_file_type_reg_yaml(name, file_template, file_format, description):
     return yaml_file_path
 
 def generate_store_metrics_yaml(name, region, elevation, elevation_unit, value, time_valid, experiment_name, experiment_wallclock):
-    yaml_file_path = os.path.join(get_work_dir(), YAML_FILE_PREFIX + dt.datetime.now().strftime("%Y%m%d%H%M%S") + '-store_metrics.yaml')
+    yaml_file_path = get_yaml_file_path('store_metrics')
     
     body = {
         'db_request_name' : 'expt_metrics',
@@ -109,7 +119,7 @@ def generate_store_metrics_yaml(name, region, elevation, elevation_unit, value,
     return yaml_file_path
 
 def generate_file_count_yaml(count, file_type, time_valid, forecast_length, folder_path, cycle, expt_name, expt_wallclock, bucket, platform, key):
-    yaml_file_path = os.path.join(get_work_dir(), YAML_FILE_PREFIX + dt.datetime.now().strftime("%Y%m%d%H%M%S") + '-file_count.yaml')
+    yaml_file_path = get_yaml_file_path('file_count')
 
     body = {
         'db_request_name': 'expt_file_counts',
@@ -134,7 +144,7 @@ def generate_file_count_yaml(count, file_type, time_valid, forecast_length, fold
     return yaml_file_path
 
 def generate_harvest_metrics_yaml(experiment_name, experiment_wallclock, hv_translator, harvest_config, is_array=False):
-    yaml_file_path = os.path.join(get_work_dir(), YAML_FILE_PREFIX + dt.datetime.now().strftime("%Y%m%d%H%M%S") + '%d' % random.randint(0, 99999) + '-harvest_metrics.yaml')
+    yaml_file_path = get_yaml_file_path('harvest_metrics')
     
     body = {
         'db_request_name' : 'harvest_metrics',
@@ -170,4 +180,68 @@ def generate_metric_type_reg_yaml(name, long_name, measurement_type, units, stat
 
     with open(yaml_file_path, 'w') as outfile:
         yaml.dump(body, outfile)
-    return yaml_file_path
\ No newline at end of file
+    return yaml_file_path
+
+def generate_get_metrics_yaml(experiment_name, experiment_wallclock, metric_names, time_valid_from, time_valid_to):
+    yaml_file_path = get_yaml_file_path('get_metrics')
+
+    body = {
+        'db_request_name' : 'expt_metrics',
+        'method': 'GET',
+        'params' : {
+            'datestr_format': '%Y-%m-%d %H:%M:%S',
+            'filters': {
+                'experiment': {
+                    'name': {'exact': experiment_name},
+                    'wallclock_start': {'from': experiment_wallclock,
+                                        'to': experiment_wallclock}
+                },
+                'metric_types': {
+                    'name': {'exact': metric_names}
+                },
+                'time_valid': {
+                    'from': time_valid_from,
+                    'to': time_valid_to
+                }
+            },
+            'ordering': [
+                {'name': 'time_valid', 'order_by': 'asc'}
+            ]
+        }
+    }
+
+    with open(yaml_file_path, 'w') as outfile:
+        yaml.dump(body, outfile)
+    return yaml_file_path
+
+def generate_get_file_counts_yaml(experiment_name, experiment_wallclock, file_types, cycle_from, cycle_to):
+    yaml_file_path = get_yaml_file_path('get_file_counts')
+
+    body = {
+        'db_request_name' : 'expt_file_counts',
+        'method': 'GET',
+        'params' : {
+            'datestr_format': '%Y-%m-%d %H:%M:%S',
+            'filters': {
+                'experiment': {
+                    'name': {'exact': experiment_name},
+                    'wallclock_start': {'from': experiment_wallclock,
+                                        'to': experiment_wallclock}
+                },
+                'file_types': {
+                    'name': {'exact': file_types}
+                },
+                'cycle': {
+                    'from': cycle_from,
+                    'to': cycle_to
+                }
+            },
+            'ordering': [
+                {'name': 'cycle', 'order_by': 'asc'}
+            ]
+        }
+    }
+
+    with open(yaml_file_path, 'w') as outfile:
+        yaml.dump(body, outfile)
+    return yaml_file_path
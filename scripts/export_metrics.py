@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+This script exports the time series of stored experiment metrics (expt_metrics)
+and file counts (expt_file_counts) for an experiment, a list of metric names or
+file types and a date range into NumPy (.npz) files, one per metric or file
+type, for dashboards and quality control. The files double as an incremental
+cache: a later export only requests, in a single bulk request per sync, the
+cycles from the lookback window (default 30 days) before the latest cycle
+already cached onwards. Cycles stored late or out of order (retries, concurrent
+chunks, catch up runs) within the window are picked up. Use --full to request
+the whole date range again.
+
+Each metric .npz file holds the arrays time_valid (datetime64[s]), value,
+region and elevation, sorted by time_valid. Each file count .npz file, under
+file_counts/, holds the arrays cycle (datetime64[s]) and count, sorted by
+cycle.
+
+Example call:
+    python3 export_metrics.py ../.env-example --metrics tmp2m_mean pressfc_mean \\
+        --file-types all_files_example --start "1994-01-01 00:00:00" --cache-dir ./metrics_cache
+"""
+
+import os
+import pathlib
+import argparse
+import datetime as dt
+import numpy as np
+from dotenv import load_dotenv
+
+import db_yaml_generator
+import submission_spool
+
+DATESTR_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_START = '1900-01-01 00:00:00'
+DEFAULT_LOOKBACK_DAYS = 30.
+FILE_COUNTS_DIR = 'file_counts'
+
+#column names of the records returned by score-db, first match is used
+METRIC_NAME_COLUMNS = ['metric_type_name', 'name']
+REGION_COLUMNS = ['region_name', 'region_id']
+FILE_TYPE_COLUMNS = ['file_type_name', 'name']
+CYCLE_COLUMNS = ['cycle', 'time_valid']
+
+def get_cache_file(cache_dir, experiment_name, metric_name):
+    return os.path.join(cache_dir, experiment_name, metric_name + '.npz')
+
+def get_file_count_cache_file(cache_dir, experiment_name, file_type):
+    return os.path.join(cache_dir, experiment_name, FILE_COUNTS_DIR, file_type + '.npz')
+
+def load_cached(cache_file):
+    if not os.path.isfile(cache_file):
+        return None
+    with np.load(cache_file, allow_pickle=False) as cached:
+        return {name: cached[name] for name in cached.files}
+
+def save_cached(cache_file, series):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    # write then rename so that an interrupted export never corrupts the cache
+    tmp_file = cache_file + '.tmp.npz'
+    np.savez(tmp_file, **series)
+    os.replace(tmp_file, cache_file)
+
+def _column(records, candidates):
+    for name in candidates:
+        if name in records.columns:
+            return records[name]
+    raise KeyError(f"score-db records have none of the columns {candidates}")
+
+def to_series(records):
+    """converts the records of one metric to column arrays"""
+    return {
+        'time_valid': np.asarray(records['time_valid'], dtype='datetime64[s]'),
+        'value': np.asarray(records['value'], dtype=np.float64),
+        'region': np.asarray(_column(records, REGION_COLUMNS), dtype=str),
+        'elevation': np.asarray(records['elevation'], dtype=np.float64),
+    }
+
+def to_file_count_series(records):
+    """converts the records of one file type to column arrays"""
+    return {
+        'cycle': np.asarray(_column(records, CYCLE_COLUMNS), dtype='datetime64[s]'),
+        'count': np.asarray(records['count'], dtype=np.int64),
+    }
+
+def merge_series(cached, new, time_name='time_valid', key_names=('region', 'elevation')):
+    """appends new to cached, a new value replaces a cached value of the same
+    time and keys (by default time_valid, region and elevation)
+    """
+    if cached is None:
+        merged = new
+    else:
+        merged = {name: np.concatenate([cached[name], new[name]]) for name in new}
+
+    keys = np.rec.fromarrays([merged[time_name].astype(np.int64)] +
+                             [merged[name] for name in key_names])
+    # np.unique returns the first occurrence, look at the reversed arrays to
+    # keep the latest
+    _, index = np.unique(keys[::-1], return_index=True)
+    index = len(keys) - 1 - index
+    index = index[np.argsort(merged[time_name][index], kind='stable')]
+    return {name: values[index] for name, values in merged.items()}
+
+def _request_records(yaml_file):
+    response = submission_spool.handle_request(yaml_file)
+    os.remove(yaml_file)
+    if not response.success:
+        print(response.message)
+        print(response.errors)
+        raise RuntimeError("score-db returned a failure message")
+    return response.details['records']
+
+def request_metrics(experiment_name, experiment_wallclock, metric_names, time_valid_from, time_valid_to):
+    yaml_file = db_yaml_generator.generate_get_metrics_yaml(experiment_name, experiment_wallclock, metric_names,
+                                                            time_valid_from, time_valid_to)
+    print(f"Requesting {len(metric_names)} metrics from {time_valid_from} to {time_valid_to}")
+    return _request_records(yaml_file)
+
+def request_file_counts(experiment_name, experiment_wallclock, file_types, cycle_from, cycle_to):
+    yaml_file = db_yaml_generator.generate_get_file_counts_yaml(experiment_name, experiment_wallclock, file_types,
+                                                                cycle_from, cycle_to)
+    print(f"Requesting the file counts of {len(file_types)} file types from {cycle_from} to {cycle_to}")
+    return _request_records(yaml_file)
+
+def get_sync_start(cached, time_name, start, lookback):
+    """returns the first cycle to request: start, or the lookback window
+    before the latest cached cycle when the cache already covers start
+    """
+    if lookback is None or cached is None or len(cached[time_name]) == 0:
+        return start
+    earliest = cached[time_name].min().astype(dt.datetime)
+    latest = cached[time_name].max().astype(dt.datetime)
+    if earliest > start:
+        return start
+    return max(start, latest - lookback)
+
+def sync(names, start, end, cache_files, request, name_columns, to_series, time_name, key_names, lookback):
+    """syncs the cache of each name ({name: cache file}) with score-db and
+    returns the series of each name between start and end
+    """
+    # names are grouped by their first cycle to request so that each group is
+    # fetched with a single request
+    groups = dict()
+    cached = dict()
+    for name in names:
+        cached[name] = load_cached(cache_files[name])
+        groups.setdefault(get_sync_start(cached[name], time_name, start, lookback), list()).append(name)
+
+    for sync_from, group in groups.items():
+        if sync_from > end:
+            continue
+        records = request(group, sync_from.strftime(DATESTR_FORMAT), end.strftime(DATESTR_FORMAT))
+        record_names = _column(records, name_columns)
+        for name in group:
+            new = to_series(records[record_names == name])
+            print(f"{name}: {len(new[time_name])} values requested")
+            cached[name] = merge_series(cached[name], new, time_name, key_names)
+            save_cached(cache_files[name], cached[name])
+
+    series = dict()
+    for name in names:
+        if cached[name] is None:
+            continue
+        in_range = ((cached[name][time_name] >= np.datetime64(start, 's')) &
+                    (cached[name][time_name] <= np.datetime64(end, 's')))
+        series[name] = {column: values[in_range] for column, values in cached[name].items()}
+    return series
+
+def export_metrics(metric_names, start, end, cache_dir, env=os.environ, lookback=dt.timedelta(days=DEFAULT_LOOKBACK_DAYS)):
+    """syncs the cache of each metric with score-db and returns the series of
+    each metric between start and end. lookback None requests the whole range.
+    """
+    experiment_name = env.get('EXPERIMENT_NAME')
+    cache_files = {metric_name: get_cache_file(cache_dir, experiment_name, metric_name)
+                   for metric_name in metric_names}
+    def request(group, time_valid_from, time_valid_to):
+        return request_metrics(experiment_name, env.get('EXPERIMENT_WALLCLOCK_START'), group,
+                               time_valid_from, time_valid_to)
+    return sync(metric_names, start, end, cache_files, request, METRIC_NAME_COLUMNS, to_series,
+                'time_valid', ('region', 'elevation'), lookback)
+
+def export_file_counts(file_types, start, end, cache_dir, env=os.environ, lookback=dt.timedelta(days=DEFAULT_LOOKBACK_DAYS)):
+    """syncs the cache of the file counts of each file type with score-db and
+    returns the series of each file type between start and end
+    """
+    experiment_name = env.get('EXPERIMENT_NAME')
+    cache_files = {file_type: get_file_count_cache_file(cache_dir, experiment_name, file_type)
+                   for file_type in file_types}
+    def request(group, cycle_from, cycle_to):
+        return request_file_counts(experiment_name, env.get('EXPERIMENT_WALLCLOCK_START'), group,
+                                   cycle_from, cycle_to)
+    return sync(file_types, start, end, cache_files, request, FILE_TYPE_COLUMNS, to_file_count_series,
+                'cycle', (), lookback)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored metrics time series to an incremental .npz cache")
+    parser.add_argument('input_env', help="file name and relative location of the environment file")
+    parser.add_argument('--metrics', nargs='+', default=[], help="names of the metric types to export")
+    parser.add_argument('--file-types', nargs='+', default=[], help="names of the file types whose counts are exported")
+    parser.add_argument('--start', default=DEFAULT_START, help="first time_valid, format %%Y-%%m-%%d %%H:%%M:%%S")
+    parser.add_argument('--end', default=None, help="last time_valid, format %%Y-%%m-%%d %%H:%%M:%%S (default: now)")
+    parser.add_argument('--cache-dir', default='metrics_cache', help="directory of the exported .npz files")
+    parser.add_argument('--lookback-days', type=float, default=DEFAULT_LOOKBACK_DAYS,
+                        help="cycles before the latest cached one requested again, to pick up late stores")
+    parser.add_argument('--full', action='store_true', help="request the whole date range, ignoring the cache")
+    args = parser.parse_args()
+    if len(args.metrics) == 0 and len(args.file_types) == 0:
+        parser.error("give --metrics and/or --file-types to export")
+
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), args.input_env)
+    load_dotenv(env_path)
+
+    start = dt.datetime.strptime(args.start, DATESTR_FORMAT)
+    if args.end is None:
+        end = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None, microsecond=0)
+    else:
+        end = dt.datetime.strptime(args.end, DATESTR_FORMAT)
+
+    lookback = None if args.full else dt.timedelta(days=args.lookback_days)
+    series = export_metrics(args.metrics, start, end, args.cache_dir, lookback=lookback)
+    for metric_name, values in series.items():
+        print(f"{metric_name}: {len(values['time_valid'])} values in "
+              f"{get_cache_file(args.cache_dir, os.getenv('EXPERIMENT_NAME'), metric_name)}")
+    series = export_file_counts(args.file_types, start, end, args.cache_dir, lookback=lookback)
+    for file_type, values in series.items():
+        print(f"{file_type}: {len(values['cycle'])} file counts in "
+              f"{get_file_count_cache_file(args.cache_dir, os.getenv('EXPERIMENT_NAME'), file_type)}")
+
+if __name__ == "__main__":
+    main()
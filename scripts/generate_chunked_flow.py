@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Generates cylc 8 workflows (flow.cylc) for long reanalysis streams where each
+task processes a chunk of N cycles in a single job through cycle_runner.py,
+instead of one job per stat per 6 hourly cycle. The file_check => store_data
+and daily dependencies of cylc8_sample_flow are kept at the chunk level: the
+daily statistics of a chunk wait for the file checks of the following chunks
+covering DAILY_LOOKAHEAD_HOURS, since the last day of a chunk needs files from
+the first cycles after it. The earlier files of a day are taken from the same
+chunk, so with daily statistics the chunks must start at T00 and cover whole
+days. A retried chunk only processes the cycles and stats which did not
+complete (cycle_runner.py records each of them).
+
+The generator reads a declarative yaml configuration (see
+cylc8_chunked_flow/chunked_flow.yaml) and writes one workflow directory per
+stream, STREAM_NAME/flow.cylc, under the output directory.
+
+Example call:
+    python3 generate_chunked_flow.py ../cylc8_chunked_flow/chunked_flow.yaml ../cylc8_chunked_flow
+"""
+
+import os
+import argparse
+import datetime as dt
+import yaml
+
+CYCLE_FORMAT = "%Y%m%dT%H"
+DA_WINDOW = 6 # hours
+# the daily analysis statistics of a T12 cycle read files up to the T06 cycle of
+# the following day (see db_daily_mean_surface_analysis.remote_files)
+DAILY_LOOKAHEAD_HOURS = 18
+HOURS_PER_DAY = 24
+
+DEFAULTS = {
+    'chunk_cycles': 28,
+    'max_active_chunks': 2,
+    'download_workers': 4,
+    'harvest_workers': 4,
+    'stats': ['file_count'],
+    'daily_stats': [],
+    'platform': None,
+    'profile': '',
+}
+
+FLOW_TEMPLATE = '''#!Jinja2
+
+#===========================
+# $$$ CYLC SUITE DOCUMENTATION BLOCK
+
+# monitoring-stats :: generated by generate_chunked_flow.py, do not edit by hand
+
+# Each task processes a chunk of {chunk_cycles} cycles ({chunk_hours} hours) with
+# cycle_runner.py.
+
+# =========================================================================
+[meta]
+	title = "{name}: chunked monitoring"
+	description = "Chunked file checks and statistics for {name}"
+
+# parameters
+{{% set MAIL_ADDRESS = '{mail_address}' %}}
+{{% set INITIAL_CYCLE_POINT = '{initial_cycle_point}' %}}
+{{% set FINAL_CYCLE_POINT = '{final_cycle_point}' %}}
+{{% set ENV_PATH = '{env_path}' %}}
+{{% set CHUNK_CYCLES = {chunk_cycles} %}}
+{{% set RUNNER_OPTIONS = '--download-workers {download_workers} --harvest-workers {harvest_workers}' %}}
+{{% set PROFILE = '{profile}' %}} # e.g. 'cprofile,tracemalloc', see task_profiler.py
+
+[scheduler]
+    UTC mode = True
+    cycle point format = %Y%m%dT%H
+    [[events]]
+        mail events = startup, shutdown
+    [[mail]]
+        to = {{{{ MAIL_ADDRESS }}}}
+
+[scheduling]
+    initial cycle point = {{{{ INITIAL_CYCLE_POINT }}}}
+    final cycle point = {{{{ FINAL_CYCLE_POINT }}}}
+    runahead limit = P{runahead}
+    [[graph]]
+{graph}
+[runtime]
+    [[root]]
+{platform}        [[[environment]]]
+            MONITORING_PROFILE = {{{{ PROFILE }}}}
+        [[[events]]]
+            mail events = submission failed, failed, retry
+        [[[mail]]]
+            to = {{{{ MAIL_ADDRESS }}}}
+
+    [[file_check]]
+        script = """
+            ${{MONITORING_PROFILE:+task_profiler.py}} cycle_runner.py $CYLC_TASK_CYCLE_POINT {{{{ FINAL_CYCLE_POINT }}}} {{{{ ENV_PATH }}}} --chunk-cycles {{{{ CHUNK_CYCLES }}}} --check-only
+        """
+        execution retry delays = 240*PT30M # if job fails, wait 30 minutes and try again
+{store_data}'''
+
+STORE_DATA_TEMPLATE = '''    [[{task}]]
+        script = """
+            ${{MONITORING_PROFILE:+task_profiler.py}} cycle_runner.py $CYLC_TASK_CYCLE_POINT {{{{ FINAL_CYCLE_POINT }}}} {{{{ ENV_PATH }}}} --chunk-cycles {{{{ CHUNK_CYCLES }}}} --stats {stats} {{{{ RUNNER_OPTIONS }}}}
+        """
+        execution retry delays = 60*PT1M # if job fails, wait one minute and retry the cycles/stats which failed
+'''
+
+def get_chunk_points(initial, final, chunk_hours):
+    points = list()
+    point = initial
+    while point <= final:
+        points.append(point)
+        point += dt.timedelta(hours=chunk_hours)
+    return points
+
+def get_daily_dependencies(recurrence_hours, chunks_ahead):
+    offsets = [f'file_check[+PT{recurrence_hours * i}H]' for i in range(1, chunks_ahead + 1)]
+    return '            ' + ' & '.join(['file_check'] + offsets) + ' => store_data_daily'
+
+def build_graph(stream, chunk_hours, points):
+    recurrence = f'PT{chunk_hours}H'
+    lines = [f'        {recurrence} = """',
+             '            file_check => store_data',
+             '        """']
+    if len(stream['daily_stats']) > 0:
+        # daily statistics of the last day of a chunk need the following
+        # chunks, the last chunks of the stream wait for the ones which exist
+        chunks_ahead = -(-DAILY_LOOKAHEAD_HOURS // chunk_hours)
+        last_points = [point.strftime(CYCLE_FORMAT) for point in points[-chunks_ahead:]]
+        lines.append(f'        # daily statistics need the file checks of the next {DAILY_LOOKAHEAD_HOURS} hours')
+        if len(points) > len(last_points):
+            lines += [f'        {recurrence}!({", ".join(last_points)}) = """',
+                      get_daily_dependencies(chunk_hours, chunks_ahead),
+                      '        """']
+        for i, point in enumerate(last_points):
+            lines += [f'        R1/{point} = """',
+                      get_daily_dependencies(chunk_hours, len(last_points) - 1 - i),
+                      '        """']
+    return '\n'.join(lines) + '\n'
+
+def generate_flow(stream):
+    chunk_cycles = int(stream['chunk_cycles'])
+    if chunk_cycles < 1:
+        raise ValueError(f"chunk_cycles must be at least 1 for stream {stream['name']}")
+    chunk_hours = chunk_cycles * DA_WINDOW
+
+    initial = dt.datetime.strptime(str(stream['initial_cycle_point']), CYCLE_FORMAT)
+    final = dt.datetime.strptime(str(stream['final_cycle_point']), CYCLE_FORMAT)
+    if len(stream['daily_stats']) > 0 and (initial.hour != 0 or chunk_hours % HOURS_PER_DAY != 0):
+        # the daily statistics of a T12 cycle also read the files of the T00
+        # cycle of the same day, which must not be in the previous chunk
+        raise ValueError(f"daily_stats need chunks of whole days starting at T00, stream "
+                         f"{stream['name']} has initial_cycle_point {initial.strftime(CYCLE_FORMAT)} "
+                         f"and chunk_cycles {chunk_cycles} (use a multiple of "
+                         f"{HOURS_PER_DAY // DA_WINDOW})")
+    points = get_chunk_points(initial, final, chunk_hours)
+
+    store_data = STORE_DATA_TEMPLATE.format(task='store_data',
+                                            stats=' '.join(stream['stats']))
+    if len(stream['daily_stats']) > 0:
+        store_data += STORE_DATA_TEMPLATE.format(task='store_data_daily',
+                                                 stats=' '.join(stream['daily_stats']))
+
+    platform = ''
+    if stream['platform'] is not None:
+        platform = f"        platform = {stream['platform']}\n"
+
+    return FLOW_TEMPLATE.format(name=stream['name'],
+                                mail_address=stream['mail_address'],
+                                initial_cycle_point=initial.strftime(CYCLE_FORMAT),
+                                final_cycle_point=final.strftime(CYCLE_FORMAT),
+                                env_path=stream['env_path'],
+                                chunk_cycles=chunk_cycles,
+                                chunk_hours=chunk_hours,
+                                download_workers=stream['download_workers'],
+                                harvest_workers=stream['harvest_workers'],
+                                runahead=max(0, int(stream['max_active_chunks']) - 1),
+                                graph=build_graph(stream, chunk_hours, points),
+                                platform=platform,
+                                profile=stream['profile'],
+                                store_data=store_data)
+
+def load_streams(config_file):
+    """returns the configuration of each stream, stream values override the
+    top level values which override DEFAULTS
+    """
+    with open(config_file, 'r') as infile:
+        config = yaml.safe_load(infile)
+
+    shared = dict(DEFAULTS)
+    shared.update({k: v for k, v in config.items() if k != 'streams'})
+
+    streams = list()
+    for stream_config in config['streams']:
+        stream = dict(shared)
+        stream.update(stream_config)
+        streams.append(stream)
+    return streams
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate chunked cylc workflows from a yaml configuration")
+    parser.add_argument('config', help="yaml configuration of the streams to monitor")
+    parser.add_argument('output_dir', help="directory in which a workflow directory is written per stream")
+    args = parser.parse_args()
+
+    for stream in load_streams(args.config):
+        flow_dir = os.path.join(args.output_dir, stream['name'])
+        os.makedirs(flow_dir, exist_ok=True)
+        flow_file = os.path.join(flow_dir, 'flow.cylc')
+        with open(flow_file, 'w') as outfile:
+            outfile.write(generate_flow(stream))
+        print(f"Wrote {flow_file}")
+
+if __name__ == "__main__":
+    main()
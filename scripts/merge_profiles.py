@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+This script combines the cProfile outputs written by task_profiler.py for many
+tasks and cycles into one profile and prints the top functions, so that hot
+spots (listing, yaml generation, harvesting, ...) stand out under real load.
+
+Example call:
+    python3 merge_profiles.py "$HOME/cylc-run/WORKFLOW/run1/log/job/*/store_data_gsi_obsfit/*/profile-*.prof" \\
+        --sort cumulative --top 30 --output gsi_obsfit.prof
+"""
+
+import glob
+import pstats
+import argparse
+
+def merge_profiles(paths):
+    stats = None
+    for path in paths:
+        if stats is None:
+            stats = pstats.Stats(path)
+        else:
+            stats.add(path)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge task_profiler.py profiles and report the top functions")
+    parser.add_argument('patterns', nargs='+', help="profile files or glob patterns (quote them)")
+    parser.add_argument('--sort', default='cumulative', help="pstats sort key, e.g. cumulative, tottime, ncalls")
+    parser.add_argument('--top', type=int, default=30, help="number of functions reported")
+    parser.add_argument('--output', default=None, help="optional file to save the merged profile to")
+    args = parser.parse_args()
+
+    paths = sorted(set(path for pattern in args.patterns
+                       for path in glob.glob(pattern, recursive=True)))
+    if len(paths) == 0:
+        raise FileNotFoundError(f"no profiles match {args.patterns}")
+
+    stats = merge_profiles(paths)
+    print(f"Merged {len(paths)} profiles")
+    if args.output is not None:
+        stats.dump_stats(args.output)
+        print(f"Merged profile written to {args.output}")
+    stats.strip_dirs().sort_stats(args.sort).print_stats(args.top)
+
+if __name__ == "__main__":
+    main()
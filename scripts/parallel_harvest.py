@@ -0,0 +1,66 @@
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Helpers to spread one harvest over several cores. A variable list is split in
+shards, one harvest request is built per shard and the requests are submitted
+from a process pool. Workers only receive the request (yaml) file and the
+paths of the shared, already downloaded files; each harvester opens the files
+itself so that no field data is pickled between processes.
+
+The number of workers is read from HARVEST_WORKERS in the environment file
+(default 1, i.e. a single request harvested serially).
+"""
+
+import os
+import concurrent.futures
+
+import submission_spool
+import task_profiler
+
+DEFAULT_HARVEST_WORKERS = 1
+
+def get_harvest_workers(env=os.environ):
+    harvest_workers = env.get('HARVEST_WORKERS')
+    if harvest_workers == '' or harvest_workers == None:
+        return DEFAULT_HARVEST_WORKERS
+    return max(1, int(harvest_workers))
+
+def shard(items, n_shards):
+    """split items in at most n_shards interleaved, non-empty shards, so that
+    neighbouring (often similarly expensive) items end up on different workers
+    """
+    n_shards = max(1, min(n_shards, len(items)))
+    return [list(items[i::n_shards]) for i in range(n_shards)]
+
+def submit_request(yaml_file, cycle_str, files, env):
+    """picklable wrapper around submission_spool.submit_request, score-db
+    responses are not sent back between processes
+    """
+    submission_spool.submit_request(yaml_file, cycle_str, files=files, env=env)
+
+def submit_requests(yaml_files, cycle_str, files=(), env=os.environ, workers=None):
+    """submit the requests of all shards, in parallel when more than one worker
+    is configured. Fails if any of the shards failed.
+    """
+    if workers is None:
+        workers = get_harvest_workers(env)
+
+    if workers <= 1 or len(yaml_files) <= 1:
+        for yaml_file in yaml_files:
+            submission_spool.submit_request(yaml_file, cycle_str, files=files, env=env)
+        return
+
+    env = dict(env)
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(yaml_files)),
+                                                initializer=task_profiler.worker_initializer) as executor:
+        futures = [executor.submit(submit_request, yaml_file, cycle_str, list(files), env)
+                   for yaml_file in yaml_files]
+        errors = list()
+        for future in concurrent.futures.as_completed(futures):
+            if future.exception() is not None:
+                print(future.exception())
+                errors.append(future.exception())
+
+    if len(errors) > 0:
+        raise RuntimeError(f"{len(errors)} of {len(yaml_files)} harvest shards failed") #generic exception to tell cylc to stop running
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+This script measures what the platform it runs on can sustain and writes a
+tuning profile (see tuning.py) for the monitoring tasks running there:
+    - CPU cores available to the job and memory (job limit when there is one)
+    - scratch disk write and read throughput
+    - S3 LIST latency (one cycle prefix) and GET throughput of one object for
+      several chunk sizes and concurrencies
+    - score-db round trip latency (recorded in the notes of the profile only)
+Measurements which are not requested (no --get-key, --list-prefix, or
+--db-repeats 0) are skipped and the settings depending on them are left out
+of the profile, so the tasks keep their defaults for those.
+
+Example call (the platform_probe workflow runs it on each platform):
+    python3 platform_probe.py ../.env-example --output tuning/batch_partition.env \\
+        --get-key 1994/01/1994010100/bfg_1994010100_fhr06_control --list-prefix 1994/01/1994010100/
+"""
+
+import os
+import time
+import pathlib
+import argparse
+import tempfile
+import statistics
+import datetime as dt
+from dotenv import load_dotenv
+
+import benchmark_transfer
+import bucket_file_count
+import db_yaml_generator
+import rate_limiter
+import storage
+import submission_spool
+import transfer
+import tuning
+
+MB = 1024 * 1024
+MEMORY_PER_HARVEST_GB = 4. # a daily harvest holds several global fields
+MAX_DOWNLOAD_WORKERS = 16
+MAX_LISTING_WORKERS = 32
+LISTING_TARGET_SECONDS = 5. # time to list one cycle prefix
+KEYS_PER_PAGE = 1000
+DISK_BLOCK_SIZE = 8 * MB
+CGROUP_MEMORY_LIMITS = ['/sys/fs/cgroup/memory.max', # cgroup v2
+                        '/sys/fs/cgroup/memory/memory.limit_in_bytes'] # cgroup v1
+
+def probe_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+def probe_memory():
+    """returns the memory (bytes) available to the job"""
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for limit_file in CGROUP_MEMORY_LIMITS:
+        try:
+            with open(limit_file) as infile:
+                limit = infile.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            memory = min(memory, int(limit))
+    return memory
+
+def probe_disk(scratch_dir, size_mb):
+    """returns the write and read throughput (MB/s) of a file of size_mb"""
+    block = os.urandom(DISK_BLOCK_SIZE)
+    n_blocks = max(1, int(size_mb * MB / DISK_BLOCK_SIZE))
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'probe')
+        start = time.perf_counter()
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT)
+        try:
+            for _ in range(n_blocks):
+                os.write(fd, block)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        write_mbps = n_blocks * DISK_BLOCK_SIZE / MB / (time.perf_counter() - start)
+
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            # drop the cached pages so the read comes from the disk
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            start = time.perf_counter()
+            while len(os.read(fd, DISK_BLOCK_SIZE)) > 0:
+                pass
+        finally:
+            os.close(fd)
+        read_mbps = n_blocks * DISK_BLOCK_SIZE / MB / (time.perf_counter() - start)
+    return write_mbps, read_mbps
+
+def probe_list(bucket, prefix):
+    """returns the number of keys under prefix and the seconds per listing
+    page (1000 keys) of a sequential listing
+    """
+    start = time.perf_counter()
+    file_count, _, _ = bucket_file_count.count_range(bucket.meta.client, bucket.name, prefix)
+    elapsed = time.perf_counter() - start
+    pages = max(1, -(-file_count // KEYS_PER_PAGE))
+    return file_count, elapsed / pages
+
+def probe_get(bucket, key, scratch_dir, chunk_sizes, concurrencies):
+    """returns [(chunk size MB, concurrency, MB/s)] of downloads of key"""
+    results = list()
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as tmp_dir:
+        file_path = os.path.join(tmp_dir, os.path.basename(key))
+        for chunk_size in chunk_sizes:
+            for concurrency in concurrencies:
+                def download(path):
+                    return transfer.download_file(bucket, key, path, chunk_size=int(chunk_size * MB),
+                                                  concurrency=concurrency)
+                size, elapsed = benchmark_transfer.time_download(download, file_path)
+                results.append((chunk_size, concurrency, size / MB / elapsed))
+                print(f"GET {chunk_size:g} MB x {concurrency}: {results[-1][2]:.1f} MB/s")
+    return results
+
+def probe_db(repeats):
+    """returns the median round trip (seconds) of a score-db request which
+    selects nothing
+    """
+    datestr = dt.datetime(1900, 1, 1).strftime("%Y-%m-%d %H:%M:%S")
+    latencies = list()
+    for _ in range(repeats):
+        yaml_file = db_yaml_generator.generate_get_metrics_yaml(os.getenv('EXPERIMENT_NAME'),
+                                                                os.getenv('EXPERIMENT_WALLCLOCK_START'),
+                                                                [], datestr, datestr)
+        start = time.perf_counter()
+        response = submission_spool.handle_request(yaml_file)
+        latencies.append(time.perf_counter() - start)
+        os.remove(yaml_file)
+        if not response.success:
+            print(response.message)
+            print(response.errors)
+            raise RuntimeError("score-db returned a failure message, the round trip was not measured")
+    return statistics.median(latencies)
+
+def derive_settings(measurements, list_rate=None):
+    """returns the tuning profile {key: value} fitting the measurements,
+    list_rate is the RATE_LIMIT_LIST_PER_SEC budget (None if not limited)
+    """
+    settings = dict()
+    cores = measurements['cores']
+    memory_gb = measurements['memory'] / (1024 * MB)
+    # processes of the cycle_runner.py pool, the daily variable shards
+    # (HARVEST_WORKERS) are left to the environment file
+    settings['CYCLE_RUNNER_WORKERS'] = max(1, min(cores, int(memory_gb // MEMORY_PER_HARVEST_GB)))
+
+    if 'list' in measurements:
+        file_count, page_seconds = measurements['list']
+        pages = -(-file_count // KEYS_PER_PAGE)
+        # a prefix of a single page says nothing about sharding, the default
+        # is kept
+        if pages > 1:
+            # enough concurrent listings to list the prefix within
+            # LISTING_TARGET_SECONDS, but no more than the LIST budget keeps busy
+            workers = -(-pages * page_seconds // LISTING_TARGET_SECONDS)
+            if list_rate is not None:
+                workers = min(workers, -(-list_rate * page_seconds // 1))
+            settings['LISTING_WORKERS'] = int(max(1, min(MAX_LISTING_WORKERS, workers)))
+
+    if 'get' in measurements:
+        # the smallest concurrency within 10% of the best throughput, extra
+        # connections only add load
+        best = max(throughput for _, _, throughput in measurements['get'])
+        chunk_size, concurrency, throughput = min(
+            (result for result in measurements['get'] if result[2] >= 0.9 * best),
+            key=lambda result: (result[1], -result[2]))
+        settings['TRANSFER_CHUNK_SIZE_MB'] = f"{chunk_size:g}"
+        settings['TRANSFER_CONCURRENCY'] = concurrency
+        # downloads end on the scratch disk, more files in flight than the
+        # disk can absorb do not help
+        settings['PREFLIGHT_THROUGHPUT_MBPS'] = int(min(best, measurements['disk_write']))
+        settings['DOWNLOAD_WORKERS'] = max(1, min(MAX_DOWNLOAD_WORKERS,
+                                                  round(measurements['disk_write'] / throughput)))
+    return settings
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the platform and write a tuning profile")
+    parser.add_argument('input_env', help="file name and relative location of the environment file")
+    parser.add_argument('--output', required=True, help="tuning profile to write")
+    parser.add_argument('--scratch-dir', default=None, help="directory to measure (default: the task work directory)")
+    parser.add_argument('--disk-mb', type=float, default=1024, help="size of the disk throughput test file (MB)")
+    parser.add_argument('--get-key', default=None, help="key of a large object to measure S3 GET throughput")
+    parser.add_argument('--list-prefix', default=None, help="prefix (e.g. a cycle) to measure S3 LIST latency")
+    parser.add_argument('--chunk-sizes', nargs='+', type=float, default=[8, 32, 64], help="chunk sizes (MB) to try")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[4, 8, 16],
+                        help="concurrent ranges to try, at least 2")
+    parser.add_argument('--db-repeats', type=int, default=5, help="score-db round trips to time, 0 to skip")
+    args = parser.parse_args()
+    if min(args.concurrency) < 2:
+        # transfer.py hands a concurrency of 1 to the boto3 managed transfer,
+        # which downloads with several threads of its own
+        parser.error("--concurrency values must be at least 2")
+
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), args.input_env)
+    load_dotenv(env_path)
+
+    scratch_dir = args.scratch_dir
+    if scratch_dir is None:
+        scratch_dir = os.getenv('CYLC_TASK_WORK_DIR', tempfile.gettempdir())
+
+    measurements = {'cores': probe_cores(), 'memory': probe_memory()}
+    measurements['disk_write'], measurements['disk_read'] = probe_disk(scratch_dir, args.disk_mb)
+    notes = [f"platform probe of {os.uname().nodename} on {dt.datetime.now(dt.timezone.utc):%Y-%m-%d %H:%M} UTC",
+             f"cores: {measurements['cores']}, memory: {measurements['memory'] / (1024 * MB):.1f} GB",
+             f"scratch disk {scratch_dir}: write {measurements['disk_write']:.0f} MB/s, "
+             f"read {measurements['disk_read']:.0f} MB/s"]
+
+    if args.list_prefix is not None or args.get_key is not None:
+        bucket = storage.get_bucket()
+    if args.list_prefix is not None:
+        file_count, page_seconds = probe_list(bucket, args.list_prefix)
+        measurements['list'] = (file_count, page_seconds)
+        notes.append(f"S3 LIST {args.list_prefix}: {file_count} keys, {page_seconds:.3f} s per page")
+    if args.get_key is not None:
+        measurements['get'] = probe_get(bucket, args.get_key, scratch_dir, args.chunk_sizes, args.concurrency)
+        notes.append(f"S3 GET {args.get_key}: best {max(result[2] for result in measurements['get']):.0f} MB/s")
+    if args.db_repeats > 0:
+        measurements['db_latency'] = probe_db(args.db_repeats)
+        notes.append(f"score-db round trip: {measurements['db_latency'] * 1000:.0f} ms")
+
+    settings = derive_settings(measurements, rate_limiter.get_rate('list'))
+    for note in notes:
+        print(note)
+    for key, value in settings.items():
+        print(f"{key} = {value}")
+    tuning.write_profile(args.output, settings, notes)
+    print(f"Tuning profile written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Preflight planner for downloads. Before anything is downloaded, all object
+keys needed by a stat for a cycle (from the remote_files() function of its
+db_{stat}.py script) are checked with one listing per prefix, narrowed to the
+common start of the file names under that prefix. The plan reports the missing
+files, the expected number of bytes and the expected download time, so that
+downloads only start once the whole file set is present.
+
+The expected time uses PREFLIGHT_THROUGHPUT_MBPS from the environment file
+(MB/s, default 100), which can be measured with benchmark_transfer.py.
+
+As a script, it reports the plan of each cycle of a date range:
+    python3 preflight.py 19940101T12 19940131T12 ../.env-example \\
+        --stats daily_mean_surface_background daily_mean_surface_analysis
+"""
+
+import os
+import pathlib
+import argparse
+import datetime as dt
+from collections import namedtuple
+from dotenv import load_dotenv
+
+import rate_limiter
+
+DEFAULT_THROUGHPUT_MBPS = 100.
+
+DownloadPlan = namedtuple('DownloadPlan', ['present', 'missing', 'total_bytes', 'expected_seconds'])
+
+def get_throughput(env=os.environ):
+    """returns the expected download throughput in bytes per second"""
+    throughput = env.get('PREFLIGHT_THROUGHPUT_MBPS')
+    if throughput == '' or throughput == None:
+        throughput = DEFAULT_THROUGHPUT_MBPS
+    return float(throughput) * 1024 * 1024
+
+def list_sizes(client, bucket_name, prefix, env=os.environ):
+    """returns {key: size} of every object under prefix, each page of the
+    listing counts against the 'list' rate limit
+    """
+    sizes = dict()
+    kwargs = {'Bucket': bucket_name, 'Prefix': prefix}
+    while True:
+        page = rate_limiter.call('list', client.list_objects_v2, env=env, **kwargs)
+        for obj in page.get('Contents', []):
+            sizes[obj['Key']] = obj['Size']
+        if not page.get('IsTruncated'):
+            return sizes
+        kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+def plan_downloads(bucket, remote_files, env=os.environ):
+    """checks that every (prefix, file name) of remote_files exists, returns a
+    DownloadPlan with the present [(prefix, file name, size)] and missing
+    [(prefix, file name)] files
+    """
+    file_names_by_prefix = dict()
+    for prefix, file_name in remote_files:
+        file_names_by_prefix.setdefault(prefix, list()).append(file_name)
+
+    sizes = dict()
+    for prefix, file_names in file_names_by_prefix.items():
+        # one listing per prefix, limited to the keys starting like the files
+        list_prefix = prefix + os.path.commonprefix(file_names)
+        sizes.update(list_sizes(bucket.meta.client, bucket.name, list_prefix, env))
+
+    present = list()
+    missing = list()
+    for prefix, file_name in remote_files:
+        if prefix + file_name in sizes:
+            present.append((prefix, file_name, sizes[prefix + file_name]))
+        else:
+            missing.append((prefix, file_name))
+
+    total_bytes = sum(size for _, _, size in present)
+    return DownloadPlan(present, missing, total_bytes, total_bytes / get_throughput(env))
+
+def describe(plan):
+    lines = [f"{len(plan.present)} files present, {len(plan.missing)} missing, "
+             f"{plan.total_bytes / (1024 * 1024):.1f} MB to download, "
+             f"expected {plan.expected_seconds:.0f} s"]
+    for prefix, file_name in plan.missing:
+        lines.append(f"    missing: {prefix}{file_name}")
+    return '\n'.join(lines)
+
+def check(plan):
+    """raises when any file of the plan is missing"""
+    if len(plan.missing) > 0:
+        print(describe(plan))
+        raise FileNotFoundError(f"{len(plan.missing)} of {len(plan.present) + len(plan.missing)} "
+                                f"files are missing, nothing was downloaded")
+
+def main():
+    # imported here so that the stat scripts and storage.py can import this module
+    import cycle_runner
+    import storage
+    import tuning
+
+    parser = argparse.ArgumentParser(description="Check that all files of a date range are present before downloading")
+    parser.add_argument('start_cycle', help="first cycle, format %%Y%%m%%dT%%H")
+    parser.add_argument('end_cycle', help="last cycle (inclusive), format %%Y%%m%%dT%%H")
+    parser.add_argument('input_env', help="file name and relative location of the environment file")
+    parser.add_argument('--stats', nargs='+', required=True, help="stats to plan, each must have a db_{stat}.py script")
+    parser.add_argument('--cycle-hours', type=int, default=6, help="hours between cycles")
+    args = parser.parse_args()
+
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), args.input_env)
+    load_dotenv(env_path)
+    tuning.apply()
+    files_storage = storage.get_storage()
+
+    total_bytes = 0
+    total_missing = 0
+    cycles = cycle_runner.get_cycles(dt.datetime.strptime(args.start_cycle, cycle_runner.CYCLE_FORMAT),
+                                     dt.datetime.strptime(args.end_cycle, cycle_runner.CYCLE_FORMAT),
+                                     args.cycle_hours)
+    for datetime_obj in cycles:
+        for stat in args.stats:
+            stat_module = cycle_runner.get_stat_module(stat)
+            cycle_hours = getattr(stat_module, 'CYCLE_HOURS', None)
+            if cycle_hours is not None and datetime_obj.hour not in cycle_hours:
+                continue
+            plan = files_storage.plan_downloads(stat_module.remote_files(datetime_obj))
+            print(f"{datetime_obj.strftime(cycle_runner.CYCLE_FORMAT)} {stat}: {describe(plan)}")
+            total_bytes += plan.total_bytes
+            total_missing += len(plan.missing)
+
+    print(f"Total: {total_missing} files missing, {total_bytes / (1024 * 1024 * 1024):.2f} GB to download, "
+          f"expected {total_bytes / get_throughput() / 60:.1f} min")
+    if total_missing > 0:
+        raise FileNotFoundError(f"{total_missing} files are missing")
+
+if __name__ == "__main__":
+    main()
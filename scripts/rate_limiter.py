@@ -0,0 +1,190 @@
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Token bucket rate limiting shared by all monitoring processes on a node, so
+that many concurrent cycles or streams stay at the sustainable request rate of
+S3 and score-db instead of swinging between overload (503 SlowDown, exhausted
+DB connections) and idle retry delays.
+
+Each budget has its own bucket, stored in a small state file under
+RATE_LIMIT_DIR and updated under an exclusive file lock:
+    list  S3 LIST requests     RATE_LIMIT_LIST_PER_SEC
+    get   S3 GET/HEAD requests RATE_LIMIT_GET_PER_SEC
+    db    score-db requests    RATE_LIMIT_DB_PER_SEC
+A budget without a configured rate is not limited. RATE_LIMIT_DB_CONNECTIONS
+additionally caps the number of score-db requests in flight at the same time.
+
+When a request is throttled by the server (S3 SlowDown, or score-db failing
+with exhausted connections or timeouts), the rate of its budget is halved for
+every process (down to MIN_RATE_FACTOR) and recovers linearly afterwards, and
+the request is retried with exponential backoff.
+"""
+
+import os
+import time
+import json
+import fcntl
+import random
+import tempfile
+import contextlib
+
+BUDGETS = {
+    'list': 'RATE_LIMIT_LIST_PER_SEC',
+    'get': 'RATE_LIMIT_GET_PER_SEC',
+    'db': 'RATE_LIMIT_DB_PER_SEC',
+}
+BURST_SECONDS = 1. # a bucket holds at most one second worth of tokens (at least one)
+MIN_RATE_FACTOR = 1. / 16
+RECOVERY_PER_SEC = 0.02 # rate factor regained per second after throttling
+MAX_RETRIES = 8
+THROTTLING_CODES = {'SlowDown', '503', 'Throttling', 'ThrottlingException',
+                    'RequestLimitExceeded', 'TooManyRequestsException'}
+# lower case parts of the score-db (database driver) errors of an overloaded
+# database, e.g. psycopg2 "sorry, too many clients already"
+DB_OVERLOAD_MESSAGES = ['too many connections', 'too many clients',
+                        'remaining connection slots', 'queuepool limit',
+                        'timed out', 'timeout expired', 'could not connect',
+                        'connection refused']
+
+def get_rate_limit_dir(env=os.environ):
+    rate_limit_dir = env.get('RATE_LIMIT_DIR')
+    if rate_limit_dir == '' or rate_limit_dir == None:
+        rate_limit_dir = os.path.join(tempfile.gettempdir(),
+                                      f"score-monitoring-rate-limits-{os.getuid()}")
+    os.makedirs(rate_limit_dir, exist_ok=True)
+    return rate_limit_dir
+
+def get_rate(budget, env=os.environ):
+    """returns the configured requests per second of a budget, None if it is
+    not limited
+    """
+    rate = env.get(BUDGETS[budget])
+    if rate == '' or rate == None:
+        return None
+    return float(rate)
+
+@contextlib.contextmanager
+def _locked_state(budget, env):
+    """yields the state of a budget under an exclusive lock, the (modified)
+    state is written back on exit
+    """
+    state_path = os.path.join(get_rate_limit_dir(env), budget + '.json')
+    with open(state_path, 'a+') as state_file:
+        fcntl.flock(state_file, fcntl.LOCK_EX)
+        try:
+            state_file.seek(0)
+            content = state_file.read()
+            now = time.time()
+            state = json.loads(content) if content != '' else {
+                'tokens': 1., 'updated': now, 'factor': 1.}
+            # refill the bucket and recover the rate since the last update
+            elapsed = max(0., now - state['updated'])
+            state['factor'] = min(1., state['factor'] + elapsed * RECOVERY_PER_SEC)
+            state['updated'] = now
+            state['elapsed'] = elapsed
+            yield state
+            del state['elapsed']
+            state_file.seek(0)
+            state_file.truncate()
+            json.dump(state, state_file)
+            state_file.flush()
+        finally:
+            fcntl.flock(state_file, fcntl.LOCK_UN)
+
+def acquire(budget, env=os.environ):
+    """blocks until a request of the budget may be sent"""
+    rate = get_rate(budget, env)
+    if rate is None:
+        return
+
+    while True:
+        with _locked_state(budget, env) as state:
+            current_rate = rate * state['factor']
+            # at least one token, so that budgets below 1 request/s still
+            # fill up to a whole request
+            state['tokens'] = min(max(1., current_rate * BURST_SECONDS),
+                                  state['tokens'] + state['elapsed'] * current_rate)
+            if state['tokens'] >= 1.:
+                state['tokens'] -= 1.
+                return
+            wait = (1. - state['tokens']) / current_rate
+        time.sleep(wait)
+
+def throttled(budget, env=os.environ):
+    """to be called when the server throttled a request of the budget"""
+    if get_rate(budget, env) is None:
+        return
+    with _locked_state(budget, env) as state:
+        state['factor'] = max(MIN_RATE_FACTOR, state['factor'] / 2.)
+        state['tokens'] = min(state['tokens'], 0.)
+        print(f"Rate limit '{budget}' throttled by the server, now at "
+              f"{state['factor']:.0%} of {get_rate(budget, env)} requests/s")
+
+def is_throttling(err):
+    response = getattr(err, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    code = str(response.get('Error', {}).get('Code'))
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in THROTTLING_CODES or status == 503
+
+def is_db_overloaded(*details):
+    """returns whether the score-db error details (exceptions, messages)
+    report exhausted connections or timeouts
+    """
+    text = ' '.join(str(detail) for detail in details).lower()
+    return any(message in text for message in DB_OVERLOAD_MESSAGES)
+
+def backoff(budget, attempt, env=os.environ):
+    """slows the budget down and waits before retry number attempt + 1, with
+    exponential backoff and jitter
+    """
+    throttled(budget, env)
+    time.sleep(random.uniform(0, min(60., 2 ** attempt)))
+
+def call(budget, func, *args, env=os.environ, **kwargs):
+    """calls func once a token of the budget is available, throttled calls
+    slow the budget down and are retried with exponential backoff and jitter
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        acquire(budget, env)
+        try:
+            return func(*args, **kwargs)
+        except Exception as err:
+            if not is_throttling(err) or attempt == MAX_RETRIES:
+                raise
+            backoff(budget, attempt, env)
+
+def get_connection_slots(env=os.environ):
+    slots = env.get('RATE_LIMIT_DB_CONNECTIONS')
+    if slots == '' or slots == None:
+        return None
+    return max(1, int(slots))
+
+@contextlib.contextmanager
+def db_connection(env=os.environ):
+    """holds one of the RATE_LIMIT_DB_CONNECTIONS score-db slots of the node
+    for the duration of a request
+    """
+    slots = get_connection_slots(env)
+    if slots is None:
+        yield
+        return
+
+    rate_limit_dir = get_rate_limit_dir(env)
+    while True:
+        for slot in random.sample(range(slots), slots):
+            slot_file = open(os.path.join(rate_limit_dir, f"db-connection-{slot}.lock"), 'a')
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                slot_file.close()
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(slot_file, fcntl.LOCK_UN)
+                slot_file.close()
+            return
+        time.sleep(random.uniform(0.1, 0.5))
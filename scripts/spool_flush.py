@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+This script submits all pending requests in the submission spool (SPOOL_DIR in
+the environment file) to score-db, one request at a time; --batch-size only
+sets how many are read from the spool at a time. It is safe to run repeatedly, e.g. as a
+retrying cylc task, since requests which were already accepted by score-db are
+never submitted again.
+
+Example call: python3 spool_flush.py ../.env-example --batch-size 500
+"""
+
+import os
+import pathlib
+import argparse
+from dotenv import load_dotenv
+
+import submission_spool
+import tuning
+
+def main():
+    parser = argparse.ArgumentParser(description="Submit spooled score-db requests one by one")
+    parser.add_argument('input_env', help="file name and relative location of the environment file")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="number of spooled requests read from the spool at a time "
+                             "(default: SPOOL_BATCH_SIZE or 500)")
+    args = parser.parse_args()
+
+    env_path = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), args.input_env)
+    load_dotenv(env_path)
+    tuning.apply()
+
+    spool_dir = submission_spool.get_spool_dir()
+    if spool_dir is None:
+        print("SPOOL_DIR is not set, nothing to flush")
+        return
+
+    print(f"Pending requests in {spool_dir}: {submission_spool.count_pending(spool_dir)}")
+    batch_size = args.batch_size
+    if batch_size is None:
+        batch_size = tuning.get_int('SPOOL_BATCH_SIZE', submission_spool.DEFAULT_BATCH_SIZE)
+    submission_spool.flush(spool_dir, batch_size)
+
+if __name__ == "__main__":
+    main()
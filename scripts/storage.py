@@ -0,0 +1,168 @@
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Storage backends behind the listing, readiness and download steps of the
+monitoring scripts, selected by STORAGE_LOCATION_PLATFORM in the environment
+file:
+    S3Storage     any S3 platform (e.g. aws_s3), files are downloaded into
+                  the work directory
+    PosixStorage  posix, lustre, gpfs or local: files are read in place under
+                  the root directory STORAGE_LOCATION_BUCKET, nothing is copied
+                  into the work directory
+
+In both cases the objects are addressed as KEY/.../file name, like in the
+bucket. fetch() returns the path handed to the harvesters; local_copies()
+returns the paths among them which are copies owned by the task, the only
+files which may be retained by the spool and removed afterwards.
+"""
+
+import os
+import collections
+import datetime as dt
+import boto3
+from botocore import UNSIGNED
+from botocore.client import Config
+from botocore.errorfactory import ClientError
+
+import bucket_file_count
+import preflight
+import transfer
+
+POSIX_PLATFORMS = ['posix', 'lustre', 'gpfs', 'local']
+S3_MAX_POOL_CONNECTIONS = 50
+
+#S3 resources are shared by all experiments using the same credentials
+_s3_resources = dict()
+
+def get_bucket(env=os.environ):
+    aws_access_key_id = env.get('AWS_ACCESS_KEY_ID')
+    aws_secret_access_key = env.get('AWS_SECRET_ACCESS_KEY')
+
+    if aws_access_key_id == '' or aws_access_key_id == None:
+        # move forward with unsigned request
+        s3_config_signature_version = UNSIGNED
+    else:
+        s3_config_signature_version = 's3v4'
+
+    resource_key = (aws_access_key_id, aws_secret_access_key)
+    if resource_key not in _s3_resources:
+        _s3_resources[resource_key] = boto3.resource(
+            's3',
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            config=Config(signature_version=s3_config_signature_version,
+                          max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+
+    return _s3_resources[resource_key].Bucket(env.get('STORAGE_LOCATION_BUCKET'))
+
+def get_storage(env=os.environ):
+    platform = env.get('STORAGE_LOCATION_PLATFORM')
+    if platform is not None and platform.lower() in POSIX_PLATFORMS:
+        return PosixStorage(env)
+    return S3Storage(env)
+
+class S3Storage:
+    def __init__(self, env=os.environ):
+        self.env = env
+        self.bucket = get_bucket(env)
+
+    def count_file_types(self, prefix, file_types):
+        return bucket_file_count.count_file_types(self.bucket, prefix, file_types, self.env)
+
+    def count_files(self, prefix):
+        file_count, latest, _ = self.count_file_types(prefix, {})
+        return file_count, latest
+
+    def plan_downloads(self, remote_files):
+        return preflight.plan_downloads(self.bucket, remote_files, self.env)
+
+    def fetch(self, prefix, file_name, work_dir, skip_missing=False):
+        """download one file into work_dir (thread safe), returns None for a
+        missing file when skip_missing is set
+        """
+        file_path = os.path.join(work_dir, file_name)
+        try:
+            transfer.download_file(self.bucket, prefix + file_name, file_path, self.env)
+        except ClientError as err:
+            if err.response['Error']['Code'] == "404" and skip_missing:
+                print(f"File {file_name} not found at {prefix}. Moving on to the next file in list")
+                return None
+            print(f"File {file_name} could not be downloaded from {prefix}")
+            print(err)
+            raise err
+        return file_path
+
+    def local_copies(self, file_paths):
+        return list(file_paths)
+
+class PosixStorage:
+    def __init__(self, env=os.environ):
+        self.env = env
+        self.root = env.get('STORAGE_LOCATION_BUCKET')
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def _scan(self, dir_path):
+        """yields the path and stat of every file under dir_path, the stat
+        comes with the directory entry where the filesystem provides it
+        """
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan(entry.path)
+                else:
+                    yield entry.path, entry.stat()
+
+    def count_file_types(self, prefix, file_types):
+        """same as bucket_file_count.count_file_types() for a directory"""
+        file_count = 0
+        latest = bucket_file_count.EARLIEST
+        type_counts = collections.Counter()
+        match = None
+        if len(file_types) > 0:
+            match = bucket_file_count.compile_file_types(file_types, prefix)
+
+        dir_path = self.path(prefix)
+        if os.path.isdir(dir_path):
+            for file_path, stat in self._scan(dir_path):
+                file_count+=1
+                modified = dt.datetime.fromtimestamp(stat.st_mtime, dt.timezone.utc)
+                if latest < modified:
+                    latest = modified
+                if match is not None:
+                    key = prefix + os.path.relpath(file_path, dir_path).replace(os.sep, '/')
+                    type_counts.update(match(key))
+        return file_count, latest, {name: type_counts[name] for name in file_types}
+
+    def count_files(self, prefix):
+        file_count, latest, _ = self.count_file_types(prefix, {})
+        return file_count, latest
+
+    def plan_downloads(self, remote_files):
+        """nothing is transferred, the plan only reports the missing files"""
+        present = list()
+        missing = list()
+        for prefix, file_name in remote_files:
+            if os.path.isfile(self.path(prefix + file_name)):
+                present.append((prefix, file_name, 0))
+            else:
+                missing.append((prefix, file_name))
+        return preflight.DownloadPlan(present, missing, 0, 0.)
+
+    def fetch(self, prefix, file_name, work_dir, skip_missing=False):
+        """returns the path of the file in place, or None for a missing file
+        when skip_missing is set
+        """
+        file_path = self.path(prefix + file_name)
+        if not os.path.isfile(file_path):
+            if skip_missing:
+                print(f"File {file_name} not found at {prefix}. Moving on to the next file in list")
+                return None
+            raise FileNotFoundError(f"File {file_name} not found at {self.path(prefix)}")
+        return file_path
+
+    def local_copies(self, file_paths):
+        # files in place belong to the storage, never to the task
+        return []
@@ -0,0 +1,211 @@
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Write-behind spool for score-db submissions. When SPOOL_DIR is set in the
+environment file, requests built by the db_*.py scripts are appended to a local
+SQLite spool instead of being sent to score-db directly, together with any
+local files the request references (e.g., downloaded files to be harvested).
+The spool is later drained in bulk by spool_flush.py, which can be re-run
+safely: each request is marked as submitted as soon as score-db accepts it.
+
+When SPOOL_DIR is not set, submit_request() calls score-db directly, exactly as
+the scripts did before.
+"""
+
+import os
+import shutil
+import sqlite3
+import hashlib
+import datetime as dt
+import yaml
+
+import db_yaml_generator
+import rate_limiter
+
+from score_db import score_db_base
+
+SPOOL_DB_NAME = 'spool.sqlite'
+SPOOL_FILES_DIR = 'files'
+DEFAULT_BATCH_SIZE = 500
+
+def get_spool_dir(env=os.environ):
+    spool_dir = env.get('SPOOL_DIR')
+    if spool_dir == '' or spool_dir is None:
+        return None
+    return spool_dir
+
+def connect(spool_dir):
+    os.makedirs(os.path.join(spool_dir, SPOOL_FILES_DIR), exist_ok=True)
+    # generous timeout, several cylc tasks may append at the same time
+    conn = sqlite3.connect(os.path.join(spool_dir, SPOOL_DB_NAME), timeout=120)
+    conn.execute('''CREATE TABLE IF NOT EXISTS requests (
+                        request_key TEXT PRIMARY KEY,
+                        db_request_name TEXT NOT NULL,
+                        cycle TEXT,
+                        body TEXT NOT NULL,
+                        spooled_at TEXT NOT NULL,
+                        submitted_at TEXT)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS requests_pending
+                    ON requests (submitted_at, spooled_at)''')
+    return conn
+
+def _retain_file(file_path, target_dir):
+    """keep a spooled copy of a referenced file, hard linking when possible so
+    that large downloads are not copied twice
+    """
+    target_path = os.path.join(target_dir, os.path.basename(file_path))
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(file_path, target_path)
+    except OSError:
+        shutil.copy2(file_path, target_path)
+    return target_path
+
+def _replace_paths(value, path_map):
+    if isinstance(value, str):
+        return path_map.get(value, value)
+    if isinstance(value, list):
+        return [_replace_paths(item, path_map) for item in value]
+    if isinstance(value, dict):
+        return {k: _replace_paths(v, path_map) for k, v in value.items()}
+    return value
+
+def spool_request(yaml_file, cycle_str, files=(), spool_dir=None):
+    """append the request in yaml_file to the spool, retaining the local files
+    it references. A request already in the spool (same content, e.g. from a
+    retried task) is not added twice.
+    """
+    with open(yaml_file, 'r') as infile:
+        request_text = infile.read()
+    request_key = hashlib.sha1(request_text.encode('utf-8')).hexdigest()
+    request = yaml.safe_load(request_text)
+
+    conn = connect(spool_dir)
+    try:
+        existing = conn.execute('SELECT submitted_at FROM requests '
+                                'WHERE request_key = ?',
+                                (request_key,)).fetchone()
+        if existing is not None:
+            print(f"Request {request_key} for cycle {cycle_str} is already "
+                  f"spooled (submitted at: {existing[0]})")
+            return request_key
+
+        path_map = dict()
+        if len(files) > 0:
+            files_dir = os.path.join(spool_dir, SPOOL_FILES_DIR, request_key)
+            os.makedirs(files_dir, exist_ok=True)
+            for file_path in files:
+                path_map[str(file_path)] = _retain_file(file_path, files_dir)
+        request = _replace_paths(request, path_map)
+
+        with conn:
+            conn.execute('INSERT INTO requests (request_key, db_request_name, '
+                         'cycle, body, spooled_at) VALUES (?, ?, ?, ?, ?)',
+                         (request_key, request.get('db_request_name'),
+                          cycle_str, yaml.safe_dump(request),
+                          dt.datetime.now(dt.timezone.utc).isoformat()))
+    finally:
+        conn.close()
+
+    print(f"Spooled {request.get('db_request_name')} request {request_key} "
+          f"for cycle: {cycle_str}")
+    return request_key
+
+def handle_request(yaml_file, env=os.environ):
+    """score-db request within the 'db' rate limit and connection slots of
+    rate_limiter.py. Requests failing because the database is overloaded
+    (exhausted connections, timeouts) slow the 'db' budget down and are
+    retried with backoff.
+    """
+    for attempt in range(rate_limiter.MAX_RETRIES + 1):
+        last_attempt = attempt == rate_limiter.MAX_RETRIES
+        with rate_limiter.db_connection(env):
+            rate_limiter.acquire('db', env)
+            try:
+                response = score_db_base.handle_request(yaml_file)
+            except Exception as err:
+                if last_attempt or not rate_limiter.is_db_overloaded(err):
+                    raise
+                print(f"score-db overloaded: {err}")
+                response = None
+        if response is not None:
+            if (response.success or last_attempt or
+                    not rate_limiter.is_db_overloaded(response.message, response.errors)):
+                return response
+            print(f"score-db overloaded: {response.message}")
+        rate_limiter.backoff('db', attempt, env)
+
+def submit_request(yaml_file, cycle_str, files=(), env=os.environ):
+    """submit a score-db request, or spool it when SPOOL_DIR is configured.
+    files lists the local files referenced by the request which must be kept
+    until the request is submitted.
+    """
+    spool_dir = get_spool_dir(env)
+    if spool_dir is not None:
+        return spool_request(yaml_file, cycle_str, files, spool_dir)
+
+    print("Calling score-db with yaml file: " + yaml_file + " for cycle: " +
+          cycle_str)
+    response = handle_request(yaml_file, env)
+    if not response.success:
+        print(response.message)
+        print(response.errors)
+        raise RuntimeError("score-db returned a failure message") #generic exception to tell cylc to stop running
+    return response
+
+def count_pending(spool_dir):
+    conn = connect(spool_dir)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM requests '
+                            'WHERE submitted_at IS NULL').fetchone()[0]
+    finally:
+        conn.close()
+
+def flush(spool_dir, batch_size=DEFAULT_BATCH_SIZE):
+    """submit every pending request in the spool to score-db, oldest first,
+    reading batch_size requests at a time. Stops at the first failure so that
+    the flush can simply be re-run once score-db is available again.
+    """
+    conn = connect(spool_dir)
+    submitted = 0
+    try:
+        while True:
+            rows = conn.execute('SELECT request_key, cycle, body FROM requests '
+                                'WHERE submitted_at IS NULL '
+                                'ORDER BY spooled_at, rowid LIMIT ?',
+                                (batch_size,)).fetchall()
+            if len(rows) == 0:
+                break
+
+            for request_key, cycle_str, body in rows:
+                yaml_file = os.path.join(db_yaml_generator.get_work_dir(),
+                                         db_yaml_generator.YAML_FILE_PREFIX +
+                                         request_key + '-spool.yaml')
+                with open(yaml_file, 'w') as outfile:
+                    outfile.write(body)
+
+                response = handle_request(yaml_file)
+                os.remove(yaml_file)
+                if not response.success:
+                    print(f"score-db rejected spooled request {request_key} "
+                          f"for cycle: {cycle_str}")
+                    print(response.message)
+                    print(response.errors)
+                    raise RuntimeError("score-db returned a failure message")
+
+                # record each success immediately so a re-run never submits
+                # the same request twice
+                with conn:
+                    conn.execute('UPDATE requests SET submitted_at = ? '
+                                 'WHERE request_key = ?',
+                                 (dt.datetime.now(dt.timezone.utc).isoformat(),
+                                  request_key))
+                shutil.rmtree(os.path.join(spool_dir, SPOOL_FILES_DIR,
+                                           request_key), ignore_errors=True)
+                submitted += 1
+            print(f"Submitted {submitted} spooled requests")
+    finally:
+        conn.close()
+    return submitted
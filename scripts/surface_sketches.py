@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Streaming percentile sketches for the daily surface fields. Every value of a
+variable is counted in a fixed set of logarithmic bins (one set for positive
+and one for negative values, relative accuracy RELATIVE_ACCURACY), so the
+sketch of a variable has the same bounded size whatever the number of grid
+points and files, is filled with vectorized np.bincount calls one field at a
+time, and sketches of several files, cycles or days are merged by adding their
+bins, like the moment aggregates.
+
+When DAILY_PERCENTILES is set in the environment file (e.g. '1,50,99'), the
+daily mean surface scripts also compute the percentiles of each variable over
+the files of the day and store them as experiment metrics named
+{segment}_{variable}_p{percentile}, which must be registered metric types.
+When SKETCH_DIR is set, the sketch of each variable and day is also saved as
+SKETCH_DIR/{segment}/{variable}/{YYYYMMDD}.npz, so that the percentiles of
+longer periods can be computed later by merging the daily sketches:
+    python3 surface_sketches.py SKETCH_DIR/background/tmp2m/199401*.npz --percentiles 1 50 99
+"""
+
+import os
+import argparse
+import numpy as np
+import xarray as xr
+
+import db_yaml_generator
+
+from score_db import file_utils
+
+RELATIVE_ACCURACY = 0.001 # e.g. within 0.3 K of a 280 K temperature
+MIN_MAGNITUDE = 1e-9 # smaller magnitudes are counted as zero
+MAX_MAGNITUDE = 1e12 # larger magnitudes are counted in the last bin
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+N_BINS = int(np.ceil(np.log(MAX_MAGNITUDE / MIN_MAGNITUDE) / np.log(GAMMA))) + 1
+
+METRIC_NAME_FORMAT = '{segment}_{variable}_p{percentile:g}'
+#metadata of the stored percentiles
+REGION = 'global'
+ELEVATION = 0.
+ELEVATION_UNIT = 'surface'
+
+def get_percentiles(env=os.environ):
+    """returns the list of percentiles to compute, None when not configured"""
+    percentiles = env.get('DAILY_PERCENTILES')
+    if percentiles == '' or percentiles == None:
+        return None
+    return [float(percentile) for percentile in percentiles.split(',')]
+
+def get_sketch_dir(env=os.environ):
+    sketch_dir = env.get('SKETCH_DIR')
+    if sketch_dir == '' or sketch_dir == None:
+        return None
+    return sketch_dir
+
+def empty_sketch():
+    return {'positive': np.zeros(N_BINS),
+            'negative': np.zeros(N_BINS),
+            'zero': np.zeros(1),
+            'minimum': np.full(1, np.inf),
+            'maximum': np.full(1, -np.inf)}
+
+def _bin_index(magnitudes):
+    index = np.floor(np.log(magnitudes / MIN_MAGNITUDE) / np.log(GAMMA))
+    return np.clip(index, 0, N_BINS - 1).astype(np.int64)
+
+def _bin_values():
+    """returns the value representing each bin, within RELATIVE_ACCURACY of
+    every value in the bin
+    """
+    lower = MIN_MAGNITUDE * GAMMA ** np.arange(N_BINS)
+    return lower * 2 * GAMMA / (GAMMA + 1)
+
+def add(sketch, values, weights=None):
+    """counts the finite values (any shape) in the sketch, with optional
+    weights (e.g. grid cell areas) of the same shape
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    if weights is None:
+        weights = np.ones(values.shape)
+    else:
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+    finite = np.isfinite(values)
+    values = values[finite]
+    weights = weights[finite]
+    if len(values) == 0:
+        return sketch
+
+    magnitudes = np.abs(values)
+    is_zero = magnitudes < MIN_MAGNITUDE
+    for name, in_sign in (('positive', (values > 0) & ~is_zero),
+                          ('negative', (values < 0) & ~is_zero)):
+        sketch[name] += np.bincount(_bin_index(magnitudes[in_sign]),
+                                    weights=weights[in_sign], minlength=N_BINS)
+    sketch['zero'] += weights[is_zero].sum()
+    sketch['minimum'] = np.minimum(sketch['minimum'], values.min())
+    sketch['maximum'] = np.maximum(sketch['maximum'], values.max())
+    return sketch
+
+def merge(sketches):
+    merged = empty_sketch()
+    for sketch in sketches:
+        for name in ('positive', 'negative', 'zero'):
+            merged[name] += sketch[name]
+        merged['minimum'] = np.minimum(merged['minimum'], sketch['minimum'])
+        merged['maximum'] = np.maximum(merged['maximum'], sketch['maximum'])
+    return merged
+
+def quantiles(sketch, percentiles):
+    """returns the value of each percentile (0-100) of the sketch"""
+    bin_values = _bin_values()
+    # bins in increasing order of value: negative bins from the largest
+    # magnitude down, zero, then positive bins
+    weights = np.concatenate([sketch['negative'][::-1], sketch['zero'], sketch['positive']])
+    values = np.concatenate([-bin_values[::-1], [0.], bin_values])
+    cumulative = np.cumsum(weights)
+    if cumulative[-1] <= 0:
+        return np.full(len(percentiles), np.nan)
+
+    ranks = np.maximum(np.asarray(percentiles, dtype=np.float64) / 100 * cumulative[-1],
+                       np.finfo(np.float64).tiny)
+    index = np.minimum(np.searchsorted(cumulative, ranks), len(values) - 1)
+    # the exact extremes are known, never report beyond them
+    return np.clip(values[index], sketch['minimum'][0], sketch['maximum'][0])
+
+def save(sketch, file_path):
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    # write then rename so that an interrupted task never leaves a partial sketch
+    tmp_file = file_path + '.tmp.npz'
+    np.savez(tmp_file, **sketch)
+    os.replace(tmp_file, file_path)
+
+def load(file_path):
+    with np.load(file_path, allow_pickle=False) as sketch:
+        return {name: sketch[name] for name in sketch.files}
+
+def sketch_files(file_paths, variables):
+    """returns {variable: sketch} over the files, reading one field at a time"""
+    sketches = {variable: empty_sketch() for variable in variables}
+    for file_path in file_paths:
+        with xr.open_dataset(file_path) as dataset:
+            for variable in variables:
+                if variable in dataset:
+                    add(sketches[variable], dataset[variable].values)
+    return sketches
+
+def get_sketch_file(sketch_dir, segment, variable, datetime_obj):
+    return os.path.join(sketch_dir, segment, variable, datetime_obj.strftime('%Y%m%d') + '.npz')
+
+def build_requests(datetime_obj, file_paths, variables, segment, env=os.environ):
+    """builds one store metrics request per variable and percentile of
+    DAILY_PERCENTILES over the files of the day
+    """
+    percentiles = get_percentiles(env)
+    sketch_dir = get_sketch_dir(env)
+    time_valid = datetime_obj.strftime("%Y-%m-%d %H:%M:%S")
+
+    yaml_files = list()
+    for variable, sketch in sketch_files(file_paths, variables).items():
+        if sketch_dir is not None:
+            save(sketch, get_sketch_file(sketch_dir, segment, variable, datetime_obj))
+
+        for percentile, value in zip(percentiles, quantiles(sketch, percentiles)):
+            if not np.isfinite(value):
+                print(f"No values of {variable} to compute percentile {percentile:g}")
+                continue
+            yaml_file = db_yaml_generator.generate_store_metrics_yaml(
+                                METRIC_NAME_FORMAT.format(segment=segment, variable=variable,
+                                                          percentile=percentile),
+                                REGION, ELEVATION, ELEVATION_UNIT, float(value), time_valid,
+                                env.get('EXPERIMENT_NAME'), env.get('EXPERIMENT_WALLCLOCK_START'))
+            # validate the configuration (yaml) file
+            file_utils.is_valid_readable_file(yaml_file)
+            yaml_files.append(yaml_file)
+    return yaml_files
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge saved daily sketches and print their percentiles")
+    parser.add_argument('sketch_files', nargs='+', help="saved .npz sketches to merge")
+    parser.add_argument('--percentiles', nargs='+', type=float, default=[1., 50., 99.], help="percentiles to compute")
+    args = parser.parse_args()
+
+    sketch = merge(load(file_path) for file_path in args.sketch_files)
+    for percentile, value in zip(args.percentiles, quantiles(sketch, args.percentiles)):
+        print(f"p{percentile:g}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Opt-in profiling wrapper for the monitoring scripts. It runs a script with its
+arguments, e.g.
+
+    task_profiler.py db_gsi_obsfit.py $CYLC_TASK_CYCLE_POINT ../.env-example
+
+and, depending on the comma separated MONITORING_PROFILE environment variable,
+profiles the run with:
+    cprofile     deterministic profile, written as a pstats file (.prof)
+    tracemalloc  top memory allocators at the end of the run (.txt)
+    sample       sampling profile with py-spy, if installed (.svg)
+When MONITORING_PROFILE is empty the script is run unchanged.
+
+Outputs are written to the cylc job log directory (CYLC_TASK_LOG_DIR, or the
+current directory outside of cylc) and named after the task and cycle, e.g.
+profile-store_data_gsi_obsfit-19800101T00.prof. Profiles of many cycles can be
+combined with merge_profiles.py.
+
+The process pools of cycle_runner.py and parallel_harvest.py, where the
+requests are built and harvested, start their workers with
+worker_initializer(), so that each worker writes its own outputs, e.g.
+profile-store_data-19800101T00-worker1234.prof. py-spy samples the workers
+itself (--subprocesses).
+
+MONITORING_PROFILE_TOP sets the number of allocators reported (default 25) and
+MONITORING_PROFILE_FRAMES the traceback depth of tracemalloc (default 1).
+"""
+
+import os
+import sys
+import shutil
+import runpy
+import cProfile
+import subprocess
+import tracemalloc
+import multiprocessing.util
+
+PROFILERS = ['cprofile', 'tracemalloc', 'sample']
+DEFAULT_TOP = 25
+DEFAULT_FRAMES = 1
+
+def get_profilers(env=os.environ):
+    profile = env.get('MONITORING_PROFILE')
+    if profile == '' or profile == None:
+        return []
+    profilers = [name.strip().lower() for name in profile.split(',') if name.strip() != '']
+    for name in profilers:
+        if name not in PROFILERS:
+            raise ValueError(f"Unknown profiler {name} in MONITORING_PROFILE, "
+                             f"expected a comma separated list of {PROFILERS}")
+    return profilers
+
+def get_output_path(kind, extension, env=os.environ, worker=None):
+    output_dir = env.get('CYLC_TASK_LOG_DIR')
+    if output_dir is None:
+        output_dir = os.getcwd()
+    task = env.get('CYLC_TASK_NAME', 'task')
+    cycle = env.get('CYLC_TASK_CYCLE_POINT', 'cycle')
+    name = f"{kind}-{task}-{cycle}"
+    if worker is not None:
+        name += f"-worker{worker}"
+    return os.path.join(output_dir, f"{name}.{extension}")
+
+def find_script(script):
+    """scripts are usually called by name from the workflow bin/ directory"""
+    if os.path.isfile(script):
+        # absolute, the scripts resolve their .env file from their own path
+        return os.path.abspath(script)
+    local_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    if os.path.isfile(local_script):
+        return local_script
+    path_script = shutil.which(script)
+    if path_script is not None:
+        return path_script
+    raise FileNotFoundError(f"Script {script} was not found")
+
+def write_allocators(snapshot, output_path, top):
+    stats = snapshot.statistics('lineno')
+    with open(output_path, 'w') as outfile:
+        outfile.write(f"Top {top} memory allocators (of {len(stats)})\n")
+        for stat in stats[:top]:
+            outfile.write(f"{stat}\n")
+            for line in stat.traceback.format()[1:]:
+                outfile.write(f"    {line}\n")
+    print(f"Memory allocators written to {output_path}")
+
+def write_outputs(profiler, env=os.environ, worker=None):
+    """write the outputs of the cProfile profiler (if any) and of tracemalloc
+    (if tracing)
+    """
+    if profiler is not None:
+        profiler.disable()
+        output_path = get_output_path('profile', 'prof', env, worker)
+        profiler.dump_stats(output_path)
+        print(f"Profile written to {output_path}")
+    if tracemalloc.is_tracing():
+        write_allocators(tracemalloc.take_snapshot(),
+                         get_output_path('memory', 'txt', env, worker),
+                         int(env.get('MONITORING_PROFILE_TOP', DEFAULT_TOP)))
+        tracemalloc.stop()
+
+def worker_initializer():
+    """initializer of the process pool workers: profiles the worker according
+    to MONITORING_PROFILE, the outputs are written when the worker exits
+    """
+    profilers = get_profilers()
+    if 'tracemalloc' in profilers:
+        if tracemalloc.is_tracing():
+            # forked workers inherit the traces of the main process
+            tracemalloc.clear_traces()
+        else:
+            tracemalloc.start(int(os.environ.get('MONITORING_PROFILE_FRAMES', DEFAULT_FRAMES)))
+    profiler = None
+    if 'cprofile' in profilers:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if profiler is not None or tracemalloc.is_tracing():
+        # pool workers leave through multiprocessing, which runs its
+        # finalizers but not atexit
+        multiprocessing.util.Finalize(None, write_outputs, args=(profiler, os.environ, os.getpid()),
+                                      exitpriority=10)
+
+def run_sampled(script, args, env=os.environ):
+    """re-run the whole command under py-spy, which also samples native and
+    child process stacks
+    """
+    py_spy = shutil.which('py-spy')
+    if py_spy is None:
+        raise RuntimeError("MONITORING_PROFILE requests 'sample' but py-spy is not installed")
+    output_path = get_output_path('sample', 'svg', env)
+    child_env = dict(env)
+    child_env['MONITORING_PROFILE'] = ','.join(p for p in get_profilers(env) if p != 'sample')
+    command = [py_spy, 'record', '--subprocesses', '-o', output_path, '--',
+               sys.executable, os.path.abspath(__file__), script] + args
+    print(f"Sampling profile written to {output_path}")
+    return subprocess.call(command, env=child_env)
+
+def run(script, args, env=os.environ):
+    profilers = get_profilers(env)
+    script = find_script(script)
+
+    if 'sample' in profilers:
+        return run_sampled(script, args, env)
+
+    sys.argv = [script] + args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+    profiler = None
+    if 'tracemalloc' in profilers:
+        tracemalloc.start(int(env.get('MONITORING_PROFILE_FRAMES', DEFAULT_FRAMES)))
+    if 'cprofile' in profilers:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        # profiles of failed runs are the interesting ones, always write them
+        write_outputs(profiler, env)
+    return 0
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: task_profiler.py SCRIPT [ARGUMENTS...]")
+        sys.exit(1)
+    sys.exit(run(sys.argv[1], sys.argv[2:]))
+
+if __name__ == "__main__":
+    main()
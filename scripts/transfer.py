@@ -0,0 +1,105 @@
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Transfer engine for downloading single large objects (e.g., bfg or gsistats
+files) from S3 as many concurrent byte ranges. The target file is preallocated
+to the object size and every range is written in place with os.pwrite, so no
+temporary part files are joined afterwards.
+
+The chunk size and the number of concurrent ranges are read from the
+environment file:
+    TRANSFER_CHUNK_SIZE_MB  size of one byte range (default 32)
+    TRANSFER_CONCURRENCY    concurrent byte ranges per object (default 8)
+Objects no larger than one chunk are downloaded with a single request. Every
+request counts against the 'get' budget of rate_limiter.py.
+"""
+
+import os
+import concurrent.futures
+
+import rate_limiter
+
+DEFAULT_CHUNK_SIZE_MB = 32
+DEFAULT_CONCURRENCY = 8
+READ_SIZE = 1024 * 1024 # bytes read from the response stream at a time
+
+def get_transfer_settings(env=os.environ):
+    """returns the chunk size (bytes) and the concurrency"""
+    chunk_size_mb = env.get('TRANSFER_CHUNK_SIZE_MB')
+    if chunk_size_mb == '' or chunk_size_mb == None:
+        chunk_size_mb = DEFAULT_CHUNK_SIZE_MB
+    concurrency = env.get('TRANSFER_CONCURRENCY')
+    if concurrency == '' or concurrency == None:
+        concurrency = DEFAULT_CONCURRENCY
+    return int(float(chunk_size_mb) * 1024 * 1024), max(1, int(concurrency))
+
+def get_ranges(size, chunk_size):
+    """returns the inclusive (first, last) byte of each chunk of an object"""
+    return [(start, min(start + chunk_size, size) - 1)
+            for start in range(0, size, chunk_size)]
+
+def _preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # not available on every platform / filesystem (e.g. some Lustre mounts)
+        os.ftruncate(fd, size)
+
+def _download_range(client, bucket_name, key, etag, fd, first, last, env):
+    # If-Match makes the download fail instead of mixing two versions of an
+    # object which is overwritten while it is being downloaded
+    response = rate_limiter.call('get', client.get_object, Bucket=bucket_name, Key=key,
+                                 IfMatch=etag, Range=f"bytes={first}-{last}", env=env)
+    offset = first
+    for data in response['Body'].iter_chunks(chunk_size=READ_SIZE):
+        view = memoryview(data)
+        while len(view) > 0:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+
+    if offset != last + 1:
+        raise IOError(f"incomplete range {first}-{last} of {key}: received "
+                      f"{offset - first} of {last - first + 1} bytes")
+    return last - first + 1
+
+def download_file(bucket, key, file_path, env=os.environ, chunk_size=None, concurrency=None):
+    """download the object key of the (boto3 resource) bucket to file_path,
+    returns the number of bytes downloaded. A missing object raises the same
+    botocore ClientError (code 404) as bucket.download_file.
+    """
+    default_chunk_size, default_concurrency = get_transfer_settings(env)
+    if chunk_size is None:
+        chunk_size = default_chunk_size
+    if concurrency is None:
+        concurrency = default_concurrency
+
+    client = bucket.meta.client
+    head = rate_limiter.call('get', client.head_object, Bucket=bucket.name, Key=key, env=env)
+    size = head['ContentLength']
+
+    if size <= chunk_size or concurrency == 1:
+        rate_limiter.call('get', client.download_file, bucket.name, key, file_path, env=env)
+        return size
+
+    # download next to the target and rename when complete, so that a failed
+    # download never leaves a truncated file under the expected name
+    tmp_path = file_path + '.part'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        _preallocate(fd, size)
+        ranges = get_ranges(size, chunk_size)
+        with concurrent.futures.ThreadPoolExecutor(min(concurrency, len(ranges))) as executor:
+            futures = [executor.submit(_download_range, client, bucket.name, key,
+                                       head['ETag'], fd, first, last, env)
+                       for first, last in ranges]
+            for future in futures:
+                future.result()
+    except BaseException:
+        os.close(fd)
+        os.remove(tmp_path)
+        raise
+    os.close(fd)
+    os.replace(tmp_path, file_path)
+    return size
@@ -0,0 +1,70 @@
+"""
+Copyright 2025 NOAA
+All rights reserved.
+
+Tuning profiles written by platform_probe.py: KEY = value lines, like the
+environment file, with the worker counts and chunk sizes measured
+to fit one platform (e.g. an HPC partition). The monitoring tasks read the
+profile named by TUNING_PROFILE in the environment file at startup with
+apply(); settings given in the environment file itself always take precedence
+over the profile.
+"""
+
+import os
+import pathlib
+from dotenv import dotenv_values
+
+TUNED_SETTINGS = ['TRANSFER_CHUNK_SIZE_MB',
+                  'TRANSFER_CONCURRENCY',
+                  'PREFLIGHT_THROUGHPUT_MBPS',
+                  'DOWNLOAD_WORKERS',
+                  'CYCLE_RUNNER_WORKERS',
+                  'LISTING_WORKERS']
+
+def get_profile_path(env=os.environ):
+    """returns the tuning profile, relative paths are relative to the workflow
+    directory like the environment file, None if no profile is configured
+    """
+    profile = env.get('TUNING_PROFILE')
+    if profile == '' or profile == None:
+        return None
+    return os.path.join(pathlib.Path(__file__).parent.parent.resolve(), profile)
+
+def load_profile(profile_path):
+    if not os.path.isfile(profile_path):
+        raise FileNotFoundError(f"Tuning profile {profile_path} was not found, run platform_probe.py "
+                                f"on this platform or unset TUNING_PROFILE")
+    return {key: value for key, value in dotenv_values(profile_path).items()
+            if key in TUNED_SETTINGS and value is not None}
+
+def apply(env=os.environ):
+    """fill the settings missing from env (os.environ or the dict of one
+    experiment) with the values of its tuning profile, returns env
+    """
+    profile_path = get_profile_path(env)
+    if profile_path is None:
+        return env
+
+    applied = list()
+    for key, value in load_profile(profile_path).items():
+        if env.get(key) == '' or env.get(key) == None:
+            env[key] = value
+            applied.append(f"{key}={value}")
+    print(f"Tuning profile {profile_path}: {', '.join(applied) if len(applied) > 0 else 'nothing applied'}")
+    return env
+
+def get_int(key, default, env=os.environ):
+    value = env.get(key)
+    if value == '' or value == None:
+        return default
+    return int(value)
+
+def write_profile(profile_path, settings, notes=()):
+    """write the {key: value} settings, preceded by the notes as comments"""
+    os.makedirs(os.path.dirname(os.path.abspath(profile_path)), exist_ok=True)
+    lines = [f"# {note}" for note in notes]
+    lines += [f"{key} = {value}" for key, value in settings.items()]
+    tmp_path = profile_path + '.tmp'
+    with open(tmp_path, 'w') as outfile:
+        outfile.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, profile_path)